@@ -0,0 +1,138 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import numpy as np
+from path_relinking import solution_distance
+from utils import batch_calculate_cost, batch_is_valid, stack_solutions
+
+# Arquivo de soluções elite mantido em disco entre execuções.
+#
+# Cada instância é identificada pelo hash da matriz de distâncias, das demandas
+# e da capacidade, de modo que arquivos diferentes com o mesmo conteúdo
+# compartilham as soluções. As soluções de uma instância ficam em
+# <directory>/<hash>.npz, ordenadas pelo custo. O arquivo é sempre reescrito
+# por inteiro em um arquivo temporário e então substituído (os.replace), então
+# uma leitura nunca encontra um arquivo parcialmente escrito. As atualizações
+# (leitura, junção e substituição) seguram um lock exclusivo em
+# <directory>/<hash>.lock, de modo que processos que atualizam a mesma
+# instância ao mesmo tempo não perdem as soluções uns dos outros.
+
+DEFAULT_DIRECTORY = 'results/archive'
+
+
+def instance_hash(D: np.ndarray, demands: np.ndarray, Q: int) -> str:
+    '''Calcula o identificador da instância.
+
+    O hash não depende do tipo escolhido para a matriz de distâncias, apenas
+    dos seus valores.
+    '''
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(D, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(demands, dtype=np.int64).tobytes())
+    h.update(int(Q).to_bytes(8, 'little'))
+    return h.hexdigest()
+
+
+def archive_path(D: np.ndarray, demands: np.ndarray, Q: int, directory: str = DEFAULT_DIRECTORY) -> str:
+    return os.path.join(directory, instance_hash(D, demands, Q) + '.npz')
+
+
+def load(D: np.ndarray, demands: np.ndarray, Q: int, directory: str = DEFAULT_DIRECTORY) -> 'list[tuple[np.ndarray, np.ndarray, int | float]]':
+    '''Lê as soluções armazenadas para a instância.
+
+    As soluções são validadas e têm o custo recalculado com a instância
+    dada; soluções inválidas são descartadas.
+
+    Args:
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+        directory (str): diretório do arquivo
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray, int | float]]: soluções (route,
+        start, custo) em ordem crescente de custo
+    '''
+    path = archive_path(D, demands, Q, directory)
+    if not os.path.exists(path):
+        return []
+    with np.load(path) as data:
+        routes = np.ascontiguousarray(data['routes'], dtype=np.int32)
+        starts = np.ascontiguousarray(data['starts'], dtype=np.bool_)
+    if routes.shape[0] == 0 or routes.shape[1] != D.shape[0]:
+        return []
+
+    costs = batch_calculate_cost(routes, starts, D)
+    valid = batch_is_valid(routes, starts, demands, Q)
+    return sorted([(routes[i], starts[i], costs[i]) for i in range(routes.shape[0]) if valid[i]], key=lambda s: s[2])
+
+
+def best(D: np.ndarray, demands: np.ndarray, Q: int, k: int = 1, directory: str = DEFAULT_DIRECTORY) -> 'list[tuple[np.ndarray, np.ndarray]]':
+    '''Retorna as k melhores soluções armazenadas para a instância, para
+    serem usadas como soluções iniciais.
+    '''
+    return [(route.copy(), start.copy()) for route, start, _ in load(D, demands, Q, directory)[:k]]
+
+
+def update(D: np.ndarray, demands: np.ndarray, Q: int, solutions: 'list[tuple[np.ndarray, np.ndarray]]', size: int = 10, directory: str = DEFAULT_DIRECTORY) -> int:
+    '''Insere novas soluções no arquivo da instância.
+
+    As soluções são unidas às já armazenadas, soluções inválidas ou
+    repetidas (mesmas arestas) são descartadas e são mantidas as size
+    melhores.
+
+    Args:
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+        solutions (list[tuple[np.ndarray, np.ndarray]]): soluções (route, start) novas
+        size (int): número máximo de soluções por instância
+        directory (str): diretório do arquivo
+
+    Returns:
+        int: número de soluções novas que entraram no arquivo
+    '''
+    new = []
+    if solutions:
+        routes, starts = stack_solutions(solutions)
+        costs = batch_calculate_cost(routes, starts, D)
+        valid = batch_is_valid(routes, starts, demands, Q)
+        new = [(routes[i], starts[i], costs[i]) for i in range(routes.shape[0]) if valid[i]]
+    if not new:
+        return 0
+
+    os.makedirs(directory, exist_ok=True)
+    path = archive_path(D, demands, Q, directory)
+    with open(path[:-len('.npz')] + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _merge(D, demands, Q, new, size, directory, path)
+
+
+def _merge(D: np.ndarray, demands: np.ndarray, Q: int, new: list, size: int, directory: str, path: str) -> int:
+    '''Junta as soluções novas às armazenadas e reescreve o arquivo; deve ser
+    chamada com o lock da instância.
+    '''
+    stored = load(D, demands, Q, directory)
+    elite = []
+    added = 0
+    for route, start, cost, is_new in sorted([(*s, False) for s in stored] + [(*s, True) for s in new], key=lambda s: (s[2], s[3])):
+        if len(elite) == size:
+            break
+        if any(solution_distance(route, start, r, s) == 0 for r, s, _ in elite):
+            continue
+        elite.append((route, start, cost))
+        added += is_new
+    if added == 0:
+        return 0
+
+    routes, starts = stack_solutions([(r, s) for r, s, _ in elite])
+    fd, tmp = tempfile.mkstemp(suffix='.npz', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, routes=routes, starts=starts, costs=np.array([c for _, _, c in elite]))
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return added
@@ -0,0 +1,98 @@
+from cvrp_input import prepare_input
+from greedy import greedy
+from local_search import local_search, local_search_first
+from utils import batch_calculate_cost, calculate_cost, is_valid, seed_numba
+from time import time
+import glob
+import numpy as np
+import pandas as pd
+
+
+def benchmark_local_search(files: 'list[str]', iters=1) -> 'list[dict]':
+    '''Compara a busca local de melhor melhora com a de primeira melhora.
+
+    Para cada instância e cada alpha do guloso, as duas buscas partem da mesma
+    solução inicial. São registrados o tempo até o ótimo local e o custo obtido.
+    '''
+    metadata = []
+    D, demands, Q = prepare_input(files[0])
+    s0 = greedy(D, demands, Q, alpha=0)
+    local_search(s0[0], s0[1], D, demands, Q)
+    local_search_first(s0[0], s0[1], D, demands, Q)
+
+    for filepath in files:
+        print(filepath)
+        D, demands, Q = prepare_input(filepath)
+        for i in range(iters):
+            for alpha in [0, 0.1, 0.2, 0.3]:
+                s0 = greedy(D, demands, Q, alpha=alpha)
+                for name, search in [('best', local_search), ('first', local_search_first)]:
+                    t0 = time()
+                    route, start = search(s0[0], s0[1], D, demands, Q)
+                    t1 = time()
+                    metadata.append({
+                        'instance': filepath,
+                        'n': D.shape[0],
+                        'alpha': alpha,
+                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'local_search': name,
+                        'iteration': i,
+                        'time': t1-t0,
+                        'cost': calculate_cost(route, start, D),
+                        'valid': is_valid(route, start, demands, Q)
+                    })
+
+    return metadata
+
+
+def benchmark_dtypes(files: 'list[str]', iters=1, evaluations=100000) -> 'list[dict]':
+    '''Compara o desempenho com a matriz de distâncias em int16 e em int32.
+
+    Para cada instância, a busca local de primeira melhora parte da mesma
+    solução inicial e da mesma semente com as duas matrizes, percorrendo
+    exatamente os mesmos movimentos; a diferença de tempo vem apenas do
+    tamanho da matriz. Também é medida a vazão do cálculo de custo
+    (evaluations avaliações de soluções aleatórias).
+    '''
+    metadata = []
+    for filepath in files:
+        print(filepath)
+        D, demands, Q = prepare_input(filepath)
+        variants = [(np.dtype(np.int16), D.astype(np.int16)), (np.dtype(np.int32), D.astype(np.int32))]
+        if D.max() > np.iinfo(np.int16).max:
+            variants = variants[1:]
+        for i in range(iters):
+            s0 = greedy(D, demands, Q, alpha=0.3)
+            routes = np.random.default_rng(i).permuted(np.tile(s0[0], (100, 1)), axis=1)
+            starts = np.tile(s0[1], (100, 1))
+            for dtype, DD in variants:
+                seed_numba(i)
+                t0 = time()
+                route, start = local_search_first(s0[0], s0[1], DD, demands, Q)
+                t1 = time()
+                for _ in range(evaluations // 100):
+                    batch_calculate_cost(routes, starts, DD)
+                t2 = time()
+                metadata.append({
+                    'instance': filepath,
+                    'n': D.shape[0],
+                    'dtype': dtype.name,
+                    'matrix_bytes': DD.nbytes,
+                    'iteration': i,
+                    'local_search_time': t1-t0,
+                    'cost': calculate_cost(route, start, DD),
+                    'evaluations_per_second': evaluations / (t2-t1),
+                })
+
+    return metadata
+
+
+if __name__ == '__main__':
+    files = glob.glob('./A-VRP/*.vrp')
+    df = pd.DataFrame(benchmark_local_search(files, iters=3))
+    df.to_csv('results/benchmark_local_search.tsv', sep='\t')
+    print(df.groupby(['n', 'local_search'])[['time', 'cost']].mean())
+
+    df = pd.DataFrame(benchmark_dtypes(files, iters=3))
+    df.to_csv('results/benchmark_dtypes.tsv', sep='\t')
+    print(df.groupby(['n', 'dtype'])[['matrix_bytes', 'local_search_time', 'evaluations_per_second']].mean())
@@ -1,6 +1,8 @@
 from io import TextIOWrapper
 import numpy as np
+import re
 from math import sqrt
+from utils import lower_bound
 
 
 def read_meta_section(f: TextIOWrapper) -> 'dict[str, str | int]':
@@ -12,7 +14,8 @@ def read_meta_section(f: TextIOWrapper) -> 'dict[str, str | int]':
         f (TextIOWrapper): arquivo para ler
     
     Returns:
-        dict: dicionário com as informações obtidas (name, comment, type, dimension, edge_weight_type, capacity)
+        dict: dicionário com as informações obtidas (name, comment, type,
+        dimension, edge_weight_type, capacity, best_known)
     '''
     line = f.readline()
     metadata = {}
@@ -23,9 +26,26 @@ def read_meta_section(f: TextIOWrapper) -> 'dict[str, str | int]':
         line = f.readline()
     metadata['dimension'] = int(metadata['dimension'])
     metadata['capacity'] = int(metadata['capacity'])
+    metadata['best_known'] = parse_best_known(metadata.get('comment', ''))
     return metadata
 
 
+def parse_best_known(comment: str) -> 'int | None':
+    '''Obtém o valor ótimo (ou o melhor conhecido) do comentário da instância.
+
+    As instâncias de Augerat et al. trazem no comentário "Optimal value: X"
+    ou "Best value: X".
+
+    Args:
+        comment (str): comentário da instância
+
+    Returns:
+        int | None: valor encontrado ou None caso o comentário não o informe
+    '''
+    match = re.search(r'(?:Optimal|Best) value: (\d+)', comment)
+    return int(match.group(1)) if match else None
+
+
 def read_coord_section(f: TextIOWrapper, dimension: int) -> 'list[dict[str, int]]':
     '''Lê as coordenadas dos nós.
 
@@ -118,38 +138,65 @@ def read_cvrp(file_path: str) -> 'tuple[dict[str, str | int], list[dict[str, int
     return meta, nodes, depots
 
 
-def dist(node_a: 'dict[str, int]', node_b: 'dict[str, int]') -> int:
+def dist(node_a: 'dict[str, int]', node_b: 'dict[str, int]', rounded: bool = True) -> 'int | float':
     '''Calcula a distância euclidiana entre dois nós _a_ e _b_.
 
     Args:
         node_a (dict[str, int]): posição (x, y) do nó _a_
         node_b (dict[str, int]): posição (x, y) do nó _b_
-    
+        rounded (bool): se a distância deve ser arredondada para inteiro
+
+    Returns:
+        int | float: distância euclidiana, arredondada para inteiro se rounded
+    '''
+    d = sqrt((node_a['x'] - node_b['x']) ** 2 + (node_a['y'] - node_b['y']) ** 2)
+    return round(d) if rounded else d
+
+
+def distance_dtype(max_distance: float, rounded: bool = True) -> np.dtype:
+    '''Escolhe o menor tipo que representa as distâncias da instância.
+
+    Distâncias arredondadas usam int16 quando cabem e int32 caso contrário;
+    distâncias não arredondadas usam float32. As funções compiladas são
+    especializadas para o tipo usado e acumulam os custos em 64 bits, então a
+    matriz pode ser a menor possível sem risco de estouro. Uma matriz
+    menor ocupa menos cache durante a busca local.
+
+    Args:
+        max_distance (float): maior distância da instância
+        rounded (bool): se as distâncias são arredondadas para inteiro
+
     Returns:
-        int: distância euclidiana arredondada para inteiro
+        np.dtype: tipo da matriz de distâncias
     '''
-    return round(sqrt((node_a['x'] - node_b['x']) ** 2 + (node_a['y'] - node_b['y']) ** 2))
+    if not rounded:
+        return np.dtype(np.float32)
+    if max_distance <= np.iinfo(np.int16).max:
+        return np.dtype(np.int16)
+    return np.dtype(np.int32)
 
 
-def get_distance_matrix(meta: 'dict[str, str | int]', nodes: 'dict[str, int]') -> np.ndarray:
+def get_distance_matrix(meta: 'dict[str, str | int]', nodes: 'dict[str, int]', rounded: bool = True) -> np.ndarray:
     '''Calcula a matriz de distâncias do grafo.
 
     Args:
         meta (dict[str, str | int]): metadados da instância
         nodes (dict[str, int]): informações dos nós do grafo
+        rounded (bool): se as distâncias devem ser arredondadas para inteiro
 
     Returns:
-        np.ndarray: matriz das distâncias entre cada nó.
+        np.ndarray: matriz das distâncias entre cada nó, do tipo escolhido
+        por distance_dtype.
     '''
-    distance_matrix = np.zeros((meta['dimension'], meta['dimension']), dtype=int)
+    distance_matrix = np.zeros((meta['dimension'], meta['dimension']))
     for i in range(distance_matrix.shape[0]):
         for j in range(i+1, distance_matrix.shape[1]):
-            distance_matrix[i, j] = distance_matrix[j, i] = dist(nodes[i], nodes[j])
+            distance_matrix[i, j] = distance_matrix[j, i] = dist(nodes[i], nodes[j], rounded)
     
-    return distance_matrix
+    return distance_matrix.astype(distance_dtype(distance_matrix.max(), rounded))
 
 
-def prepare_input(filepath: str) -> 'tuple[np.ndarray, np.ndarray, int]':
+def prepare_input(filepath: str, rounded: bool = True, with_bound: bool = False) -> 'tuple[np.ndarray, np.ndarray, int] | tuple[np.ndarray, np.ndarray, int, int, bool]':
     '''Lê o arquivo e prepara a instância na representação apropriada.
 
     Cria a matriz de distâncias e o vetor de demandas do arquivo .vrp
@@ -157,14 +204,56 @@ def prepare_input(filepath: str) -> 'tuple[np.ndarray, np.ndarray, int]':
 
     Args:
         filepath (str): caminho para o arquivo
+        rounded (bool): se as distâncias devem ser arredondadas para inteiro
+            (como nas instâncias EUC_2D)
+        with_bound (bool): se também deve ser retornada a referência de custo
+            da instância (ver instance_bound)
 
     Returns:
         tuple[np.ndarray, np.ndarray, int]: matriz de distâncias, vetor de demandas, capacidade dos veículos
+        e, se with_bound, o valor de referência e se ele é o valor conhecido da instância
     '''
     meta, nodes, _ = read_cvrp(filepath)
-    D = get_distance_matrix(meta, nodes)
-    demands = np.array([n['demand'] for n in nodes])
+    D = get_distance_matrix(meta, nodes, rounded)
+    demands = np.array([n['demand'] for n in nodes], dtype=np.int32)
     Q = meta['capacity']
 
+    if with_bound:
+        return (D, demands, Q, *instance_bound(meta, D, demands, Q))
     return D, demands, Q
-    
\ No newline at end of file
+    
+
+def prepare_coordinates(filepath: str) -> np.ndarray:
+    '''Lê o arquivo e obtém as coordenadas dos nós.
+
+    As coordenadas não fazem parte da representação usada pelas
+    metaheurísticas, mas são necessárias para particionar a instância (sweep).
+
+    Args:
+        filepath (str): caminho para o arquivo
+
+    Returns:
+        np.ndarray: matriz (n, 2) com as posições (x, y) de cada nó
+    '''
+    _, nodes, _ = read_cvrp(filepath)
+    return np.array([(n['x'], n['y']) for n in nodes])
+
+
+def instance_bound(meta: 'dict[str, str | int]', D: np.ndarray, demands: np.ndarray, Q: int) -> 'tuple[int, bool]':
+    '''Obtém uma referência de custo para a instância.
+
+    Usa o valor ótimo (ou melhor conhecido) informado no arquivo. Caso não
+    exista, calcula um limitante inferior a partir da instância.
+
+    Args:
+        meta (dict[str, str | int]): metadados da instância
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+
+    Returns:
+        tuple[int, bool]: valor de referência e se ele é o valor conhecido da instância
+    '''
+    if meta['best_known'] is not None:
+        return meta['best_known'], True
+    return lower_bound(D, demands, Q), False
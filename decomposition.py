@@ -0,0 +1,241 @@
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from greedy import greedy
+from utils import calculate_cost, seed_numba
+import metaheuristics
+
+
+def sweep_partition(coords: np.ndarray, demands: np.ndarray, Q: int, max_size: int = 100) -> 'list[np.ndarray]':
+    '''Particiona os clientes por varredura polar em torno do depósito.
+
+    Os clientes são ordenados pelo ângulo em relação ao depósito e agrupados
+    em setores consecutivos de no máximo max_size clientes. Cada setor é
+    fechado em um número inteiro de veículos (soma das demandas próxima de
+    um múltiplo de Q) para não desperdiçar capacidade na junção.
+
+    Args:
+        coords (np.ndarray): posições (x, y) de cada nó
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+        max_size (int): número máximo de clientes em cada parte
+
+    Returns:
+        list[np.ndarray]: índices dos clientes de cada parte
+    '''
+    delta = coords[1:] - coords[0]
+    angles = np.arctan2(delta[:, 1], delta[:, 0])
+    # começa a varredura no maior intervalo angular entre clientes consecutivos
+    order = np.argsort(angles)
+    gaps = np.diff(np.append(angles[order], angles[order[0]] + 2 * np.pi))
+    order = np.roll(order, -(np.argmax(gaps) + 1)) + 1
+
+    parts = []
+    current = []
+    load = 0
+    for node in order:
+        current.append(node)
+        load += demands[node]
+        # fecha a parte quando atinge o tamanho máximo ou completa um veículo
+        # após passar da metade do tamanho máximo
+        if len(current) >= max_size or (len(current) >= max_size // 2 and load % Q > Q - demands.max()):
+            parts.append(np.array(current))
+            current = []
+            load = 0
+    if current:
+        parts.append(np.array(current))
+
+    return parts
+
+
+def route_partition(routes: 'list[np.ndarray]', D: np.ndarray, routes_per_part: int = 5, seed: 'int | None' = None) -> 'list[np.ndarray]':
+    '''Agrupa rotas próximas da solução atual.
+
+    Seguindo a ideia do POPMUSIC, cada grupo é formado por uma rota semente
+    e as rotas mais próximas dela ainda não atribuídas. A distância entre duas
+    rotas é a menor distância entre um cliente de cada uma.
+
+    Args:
+        routes (list[np.ndarray]): clientes de cada rota da solução atual
+        D (np.ndarray): matriz de distâncias
+        routes_per_part (int): número de rotas em cada grupo
+        seed (int | None): semente para a escolha das rotas semente
+
+    Returns:
+        list[np.ndarray]: índices das rotas de cada grupo
+    '''
+    n_routes = len(routes)
+    route_dist = np.zeros((n_routes, n_routes))
+    for a in range(n_routes):
+        for b in range(a + 1, n_routes):
+            route_dist[a, b] = route_dist[b, a] = D[np.ix_(routes[a], routes[b])].min()
+
+    rng = np.random.default_rng(seed)
+    free = np.ones(n_routes, dtype=bool)
+    groups = []
+    for r in rng.permutation(n_routes):
+        if not free[r]:
+            continue
+        candidates = np.argwhere(free).flatten()
+        nearest = candidates[np.argsort(route_dist[r, candidates])][:routes_per_part]
+        free[nearest] = False
+        groups.append(nearest)
+
+    return groups
+
+
+def split_routes(route: np.ndarray, start: np.ndarray) -> 'list[np.ndarray]':
+    '''Separa o vetor de rotas concatenadas em uma lista de rotas.
+    '''
+    route_starts = np.argwhere(start).flatten()
+    return np.split(route[1:], route_starts[1:] - 1)
+
+
+def join_routes(routes: 'list[np.ndarray]') -> 'tuple[np.ndarray, np.ndarray]':
+    '''Monta a representação de rotas concatenadas a partir de uma lista de rotas.
+    '''
+    route = np.concatenate([[0]] + list(routes)).astype(np.int32)
+    start = np.zeros(route.shape[0], dtype=np.bool_)
+    start[1 + np.cumsum([0] + [len(r) for r in routes[:-1]])] = True
+    return route, start
+
+
+def subproblem(D: np.ndarray, demands: np.ndarray, customers: np.ndarray) -> 'tuple[np.ndarray, np.ndarray, np.ndarray]':
+    '''Cria a instância reduzida contendo o depósito e os clientes selecionados.
+
+    Args:
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        customers (np.ndarray): índices dos clientes do subproblema
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: índices originais dos nós,
+        matriz de distâncias e vetor de demandas do subproblema
+    '''
+    nodes = np.concatenate(([0], customers)).astype(np.int32)
+    sub_D = np.ascontiguousarray(D[np.ix_(nodes, nodes)])
+    sub_demands = np.ascontiguousarray(demands[nodes])
+    return nodes, sub_D, sub_demands
+
+
+def solve_subproblem(D: np.ndarray, demands: np.ndarray, Q: int, nodes: np.ndarray, metaheuristic: str = 'ils', alpha: float = 0, seed: 'int | None' = None, kwargs: 'dict | None' = None) -> 'tuple[np.ndarray, np.ndarray]':
+    '''Resolve um subproblema com uma das metaheurísticas.
+
+    A solução é construída pelo guloso e melhorada pela metaheurística
+    escolhida pelo nome (função em metaheuristics). A rota retornada usa os
+    índices originais dos nós.
+
+    Args:
+        D (np.ndarray): matriz de distâncias do subproblema
+        demands (np.ndarray): vetor de demandas do subproblema
+        Q (int): capacidade dos veículos
+        nodes (np.ndarray): índices originais dos nós do subproblema
+        metaheuristic (str): nome da função em metaheuristics
+        alpha (float): parâmetro do guloso
+        seed (int | None): semente do gerador aleatório
+        kwargs (dict | None): parâmetros da metaheurística
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: rotas (índices originais) e inícios de rotas
+    '''
+    if seed is not None:
+        seed_numba(seed)
+    kwargs = dict(kwargs or {})
+    # o ILS remove k vértices, o subproblema pode ter menos clientes que isso
+    if 'k' in kwargs:
+        kwargs['k'] = min(kwargs['k'], D.shape[0] - 1)
+    route, start = greedy(D, demands, Q, alpha)
+    route, start = getattr(metaheuristics, metaheuristic)(route, start, D, demands, Q, **kwargs)
+    return nodes[route], start
+
+
+def solve_parts(D: np.ndarray, demands: np.ndarray, Q: int, parts: 'list[np.ndarray]', metaheuristic: str = 'ils', kwargs: 'dict | None' = None, executor: 'ProcessPoolExecutor | None' = None, seed: 'int | None' = None) -> 'list[tuple[np.ndarray, np.ndarray]]':
+    '''Resolve cada parte como um subproblema independente.
+
+    Se um executor for informado os subproblemas são resolvidos em paralelo.
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: solução de cada parte com os índices originais
+    '''
+    jobs = []
+    for p, customers in enumerate(parts):
+        nodes, sub_D, sub_demands = subproblem(D, demands, customers)
+        job_seed = None if seed is None else seed + p
+        jobs.append((sub_D, sub_demands, Q, nodes, metaheuristic, 0, job_seed, kwargs))
+
+    if executor is None:
+        return [solve_subproblem(*job) for job in jobs]
+    return list(executor.map(solve_subproblem, *zip(*jobs)))
+
+
+def stitch(solutions: 'list[tuple[np.ndarray, np.ndarray]]') -> 'tuple[np.ndarray, np.ndarray]':
+    '''Junta as soluções das partes em uma única solução.
+
+    Cada solução parcial possui o depósito na posição 0, que é descartado
+    antes da concatenação.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: vetor de rotas concatenadas e vetor de inícios de rota
+    '''
+    route = np.concatenate([[0]] + [r[1:] for r, _ in solutions]).astype(np.int32)
+    start = np.concatenate([[False]] + [s[1:] for _, s in solutions]).astype(np.bool_)
+    return route, start
+
+
+def decomposition(D: np.ndarray, demands: np.ndarray, Q: int, coords: 'np.ndarray | None' = None, metaheuristic: str = 'ils', kwargs: 'dict | None' = None, max_size: int = 100, routes_per_part: int = 5, max_rounds: int = 10, workers: int = 1, seed: 'int | None' = None) -> 'tuple[np.ndarray, np.ndarray]':
+    '''Resolve instâncias grandes por decomposição em subproblemas.
+
+    A solução inicial é obtida particionando os clientes por varredura polar
+    (quando as coordenadas são conhecidas) ou pelo guloso sobre a instância
+    inteira. Em seguida, a cada rodada, as rotas são agrupadas com suas
+    vizinhas (POPMUSIC) e cada grupo é reotimizado como um subproblema; os
+    grupos que melhoraram substituem suas rotas na solução. Para quando uma
+    rodada inteira não melhora nenhum grupo ou após max_rounds rodadas.
+
+    Args:
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+        coords (np.ndarray | None): posições (x, y) de cada nó
+        metaheuristic (str): nome da função em metaheuristics usada nos subproblemas
+        kwargs (dict | None): parâmetros da metaheurística
+        max_size (int): número máximo de clientes por parte na varredura
+        routes_per_part (int): número de rotas em cada subproblema do POPMUSIC
+        max_rounds (int): número máximo de rodadas de reotimização
+        workers (int): número de processos para resolver os subproblemas
+        seed (int | None): semente do gerador aleatório
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: vetor de rotas concatenadas e vetor de inícios de rota
+    '''
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1 else None
+    try:
+        if coords is not None:
+            parts = sweep_partition(coords, demands, Q, max_size)
+            route, start = stitch(solve_parts(D, demands, Q, parts, metaheuristic, kwargs, executor, seed))
+        else:
+            route, start = greedy(D, demands, Q, 0)
+
+        for i in range(max_rounds):
+            round_seed = None if seed is None else seed + (i + 1) * len(demands)
+            routes = split_routes(route, start)
+            groups = route_partition(routes, D, routes_per_part, round_seed)
+            parts = [np.concatenate([routes[r] for r in g]) for g in groups]
+            solutions = solve_parts(D, demands, Q, parts, metaheuristic, kwargs, executor, round_seed)
+
+            # mantém as rotas atuais dos grupos que não melhoraram
+            improved = False
+            for p, g in enumerate(groups):
+                current = join_routes([routes[r] for r in g])
+                if calculate_cost(*solutions[p], D) < calculate_cost(*current, D):
+                    improved = True
+                else:
+                    solutions[p] = current
+            route, start = stitch(solutions)
+            if not improved:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return route, start
@@ -1,7 +1,7 @@
 import numpy as np
-from numba import njit, types
+from profiling import njit
 
-@njit(types.int64(types.int32[:,::1], types.int32[::1], types.int64, types.boolean[::1], types.int64, types.int64, types.float64))
+@njit
 def get_next_node(D: np.ndarray, demands: np.ndarray, Q: int, visited: np.ndarray, current_node: int, current_capacity: int = 0, alpha: float = 0):
     '''Calcula o próximo nó baseado na heurística de vizinho mais próximo.
 
@@ -27,7 +27,7 @@ def get_next_node(D: np.ndarray, demands: np.ndarray, Q: int, visited: np.ndarra
     # caso não haja um candidato válido
     return -1
 
-@njit(types.Tuple((types.int32[::1], types.boolean[::1]))(types.int32[:,::1], types.int32[::1], types.int64, types.float64))
+@njit
 def greedy(D: np.ndarray, demands: np.ndarray, Q: int, alpha: float = 0):
     '''Constrói uma solução de forma semi-gulosa.
 
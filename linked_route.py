@@ -0,0 +1,410 @@
+import numpy as np
+from profiling import njit
+from utils import zero_costs
+
+# Representação alternativa da solução por listas duplamente encadeadas.
+#
+# Uma instância com n nós (0 é o depósito) pode ter no máximo n-1 rotas. Cada
+# rota r possui um nó sentinela n+r que representa o depósito no início e no
+# fim da rota, de forma que cada rota é uma lista circular
+# sentinela -> clientes -> sentinela. A solução é uma tupla de vetores:
+#
+#   succ[i], pred[i]: sucessor e predecessor do nó i (cliente ou sentinela)
+#   route_of[i]: índice da rota do nó i
+#   pos[i]: chave de ordem do nó i na sua rota, crescente a partir da
+#       sentinela (0) e com lacunas de tamanho GAP entre nós consecutivos
+#   cum_load[i]: soma das demandas da rota do início até o nó i (inclusive),
+#       válida apenas se a rota não estiver marcada em dirty
+#   load[r], cost[r]: carga e custo da rota r
+#   dirty[r]: se cum_load da rota r precisa ser recalculado
+#
+# relocate e exchange alteram um número constante de ligações e atualizam
+# carga e custo das rotas pela variação já calculada; a posição do nó movido
+# é o ponto médio da lacuna entre os vizinhos, e a rota só é renumerada quando
+# a lacuna se esgota, o que dá custo O(1) amortizado. O 2-opt* reatribui rota
+# e posição aos nós dos finais de rota trocados, com custo proporcional ao
+# tamanho desses finais. cum_load é recalculado apenas quando consultado.
+
+SUCC, PRED, ROUTE_OF, POS, CUM_LOAD, LOAD, COST, DIRTY = range(8)
+
+GAP = 1 << 20
+
+
+@njit
+def loc(i, n):
+    '''Retorna o nó da matriz de distâncias correspondente ao nó i
+    (sentinelas correspondem ao depósito).
+    '''
+    return i if i < n else 0
+
+
+@njit
+def renumber(sol, D, demands, r):
+    '''Recalcula rota, posição, carga acumulada, carga e custo dos nós da rota r.
+    '''
+    succ, _, route_of, pos, cum_load, load, cost, dirty = sol
+    n = D.shape[0]
+    s = n + r
+    route_of[s] = r
+    pos[s] = 0
+    cum_load[s] = 0
+    c = 0
+    prev = 0
+    p = 0
+    total = 0
+    i = succ[s]
+    while i != s:
+        p += 1
+        total += demands[i]
+        route_of[i] = r
+        pos[i] = p * GAP
+        cum_load[i] = total
+        c += D[prev, i]
+        prev = i
+        i = succ[i]
+    load[r] = total
+    cost[r] = c + D[prev, 0] if p > 0 else 0
+    dirty[r] = False
+
+
+@njit
+def cumulative_load(sol, D, demands, i):
+    '''Carga acumulada da rota do nó i até ele, recalculando a rota se
+    necessário.
+    '''
+    r = sol[ROUTE_OF][i]
+    if sol[DIRTY][r]:
+        renumber(sol, D, demands, r)
+    return sol[CUM_LOAD][i]
+
+
+@njit
+def to_linked(route, start, D, demands):
+    '''Converte a representação de rotas concatenadas para a representação
+    encadeada em O(n).
+    '''
+    n = route.shape[0]
+    R = n - 1
+    succ = np.arange(n + R).astype(np.int32)
+    pred = np.arange(n + R).astype(np.int32)
+    route_of = np.full(n + R, -1, dtype=np.int32)
+    pos = np.zeros(n + R, dtype=np.int64)
+    cum_load = np.zeros(n + R, dtype=np.int64)
+    load = np.zeros(R, dtype=np.int64)
+    cost = zero_costs(D, R)
+    dirty = np.zeros(R, dtype=np.bool_)
+    sol = (succ, pred, route_of, pos, cum_load, load, cost, dirty)
+
+    r = -1
+    prev = 0
+    for i in range(1, n):
+        if start[i]:
+            # fecha a rota anterior e abre a próxima a partir da sua sentinela
+            if r >= 0:
+                succ[prev] = n + r
+                pred[n + r] = prev
+            r += 1
+            prev = n + r
+        u = route[i]
+        succ[prev] = u
+        pred[u] = prev
+        prev = u
+    succ[prev] = n + r
+    pred[n + r] = prev
+
+    for q in range(R):
+        renumber(sol, D, demands, q)
+
+    return sol
+
+
+@njit
+def to_flat(sol):
+    '''Converte a representação encadeada para rotas concatenadas e vetor de
+    inícios de rota em O(n). Rotas vazias são descartadas.
+    '''
+    succ = sol[SUCC]
+    R = sol[LOAD].shape[0]
+    n = R + 1
+    route = np.zeros(n, dtype=np.int32)
+    start = np.zeros(n, dtype=np.bool_)
+    i = 1
+    for r in range(R):
+        s = n + r
+        u = succ[s]
+        if u == s:
+            continue
+        start[i] = True
+        while u != s:
+            route[i] = u
+            i += 1
+            u = succ[u]
+    return route, start
+
+
+@njit
+def total_cost(sol):
+    '''Custo da solução, soma dos custos das rotas.
+    '''
+    return sol[COST].sum()
+
+
+@njit
+def relocate_delta(sol, D, demands, Q, u, v):
+    '''Avalia mover o cliente u para depois do nó v.
+
+    Returns:
+        tuple[bool, int]: se o movimento é viável e a variação do custo
+    '''
+    succ, pred, route_of, _, _, load, _, _ = sol
+    n = D.shape[0]
+    if v == u or v == pred[u]:
+        return False, 0
+    if route_of[u] != route_of[v] and load[route_of[v]] + demands[u] > Q:
+        return False, 0
+    p, s, w = loc(pred[u], n), loc(succ[u], n), loc(succ[v], n)
+    lv = loc(v, n)
+    delta = D[p, s] - D[p, u] - D[u, s] + D[lv, u] + D[u, w] - D[lv, w]
+    return True, delta
+
+
+@njit
+def relocate(sol, D, demands, u, v):
+    '''Move o cliente u para depois do nó v.
+    '''
+    succ, pred, route_of, pos, _, load, cost, dirty = sol
+    n = D.shape[0]
+    ru, rv = route_of[u], route_of[v]
+    p, s, w = pred[u], succ[u], succ[v]
+    lp, ls, lv, lw = loc(p, n), loc(s, n), loc(v, n), loc(w, n)
+    cost[ru] += D[lp, ls] - D[lp, u] - D[u, ls]
+    cost[rv] += D[lv, u] + D[u, lw] - D[lv, lw]
+    load[ru] -= demands[u]
+    load[rv] += demands[u]
+    dirty[ru] = dirty[rv] = True
+
+    # retira u da rota
+    succ[p] = s
+    pred[s] = p
+    # insere u entre v e seu sucessor
+    succ[v] = u
+    pred[u] = v
+    succ[u] = w
+    pred[w] = u
+    route_of[u] = rv
+
+    # posição no meio da lacuna entre v e w (w sentinela: fim da rota)
+    upper = pos[w] if w < n else pos[v] + 2 * GAP
+    if upper - pos[v] >= 2:
+        pos[u] = (pos[v] + upper) // 2
+    else:
+        renumber(sol, D, demands, rv)
+
+
+@njit
+def exchange_delta(sol, D, demands, Q, u, v):
+    '''Avalia trocar de posição os clientes u e v.
+
+    Returns:
+        tuple[bool, int]: se o movimento é viável e a variação do custo
+    '''
+    succ, pred, route_of, _, _, load, _, _ = sol
+    n = D.shape[0]
+    if u == v:
+        return False, 0
+    # clientes adjacentes: a troca equivale a mover um deles para depois do outro
+    if succ[u] == v:
+        return relocate_delta(sol, D, demands, Q, u, v)
+    if succ[v] == u:
+        return relocate_delta(sol, D, demands, Q, v, u)
+    ru, rv = route_of[u], route_of[v]
+    if ru != rv and (load[ru] - demands[u] + demands[v] > Q or load[rv] - demands[v] + demands[u] > Q):
+        return False, 0
+    pu, su = loc(pred[u], n), loc(succ[u], n)
+    pv, sv = loc(pred[v], n), loc(succ[v], n)
+    delta = D[pu, v] + D[v, su] + D[pv, u] + D[u, sv] - D[pu, u] - D[u, su] - D[pv, v] - D[v, sv]
+    return True, delta
+
+
+@njit
+def exchange(sol, D, demands, u, v):
+    '''Troca de posição os clientes u e v.
+    '''
+    succ, pred, route_of, pos, _, load, cost, dirty = sol
+    if succ[u] == v:
+        relocate(sol, D, demands, u, v)
+        return
+    if succ[v] == u:
+        relocate(sol, D, demands, v, u)
+        return
+    n = D.shape[0]
+    ru, rv = route_of[u], route_of[v]
+    pu, su = pred[u], succ[u]
+    pv, sv = pred[v], succ[v]
+    lpu, lsu, lpv, lsv = loc(pu, n), loc(su, n), loc(pv, n), loc(sv, n)
+    cost[ru] += D[lpu, v] + D[v, lsu] - D[lpu, u] - D[u, lsu]
+    cost[rv] += D[lpv, u] + D[u, lsv] - D[lpv, v] - D[v, lsv]
+    load[ru] += demands[v] - demands[u]
+    load[rv] += demands[u] - demands[v]
+    dirty[ru] = dirty[rv] = True
+
+    succ[pu] = v
+    pred[v] = pu
+    succ[v] = su
+    pred[su] = v
+    succ[pv] = u
+    pred[u] = pv
+    succ[u] = sv
+    pred[sv] = u
+    route_of[u], route_of[v] = rv, ru
+    pos[u], pos[v] = pos[v], pos[u]
+
+
+@njit
+def two_opt_star_delta(sol, D, demands, Q, u, v):
+    '''Avalia o 2-opt* entre as rotas de u e v: as arestas (u, succ[u]) e
+    (v, succ[v]) são removidas e os finais das rotas são trocados. Os nós u e
+    v podem ser sentinelas (troca da rota inteira a partir do início).
+
+    Returns:
+        tuple[bool, int]: se o movimento é viável e a variação do custo
+    '''
+    succ, _, route_of, _, _, load, _, _ = sol
+    n = D.shape[0]
+    ru, rv = route_of[u], route_of[v]
+    if ru == rv:
+        return False, 0
+    cu = cumulative_load(sol, D, demands, u)
+    cv = cumulative_load(sol, D, demands, v)
+    if cu + load[rv] - cv > Q or cv + load[ru] - cu > Q:
+        return False, 0
+    lu, lv = loc(u, n), loc(v, n)
+    a, b = loc(succ[u], n), loc(succ[v], n)
+    delta = D[lu, b] + D[lv, a] - D[lu, a] - D[lv, b]
+    return True, delta
+
+
+@njit
+def move_tail(sol, D, demands, u, r):
+    '''Reatribui à rota r os nós que seguem u na sua rota, com posições
+    depois da de u. Retorna a carga e o custo desse final de rota (incluindo a
+    volta ao depósito).
+    '''
+    succ, _, route_of, pos, _, _, _, _ = sol
+    n = D.shape[0]
+    s = n + route_of[u]
+    load, cost = 0, D[0, 0] + 0
+    p = pos[u]
+    i = succ[u]
+    while i != s:
+        load += demands[i]
+        nxt = succ[i]
+        cost += D[i, loc(nxt, n)]
+        p += GAP
+        route_of[i] = r
+        pos[i] = p
+        i = nxt
+    return load, cost
+
+
+@njit
+def two_opt_star(sol, D, demands, u, v):
+    '''Aplica o 2-opt* entre as rotas de u e v: u passa a ser seguido pelo
+    final da rota de v e v pelo final da rota de u.
+    '''
+    succ, pred, route_of, _, _, load, cost, dirty = sol
+    n = D.shape[0]
+    ru, rv = route_of[u], route_of[v]
+    su, sv = n + ru, n + rv
+    a, b = succ[u], succ[v]
+    last_u, last_v = pred[su], pred[sv]
+    lu, lv = loc(u, n), loc(v, n)
+
+    # os finais trocam de rota; carga e custo são ajustados pelos finais
+    tail_load_u, tail_cost_u = move_tail(sol, D, demands, u, rv)
+    tail_load_v, tail_cost_v = move_tail(sol, D, demands, v, ru)
+    cost[ru] += D[lu, loc(b, n)] + tail_cost_v - D[lu, loc(a, n)] - tail_cost_u
+    cost[rv] += D[lv, loc(a, n)] + tail_cost_u - D[lv, loc(b, n)] - tail_cost_v
+    load[ru] += tail_load_v - tail_load_u
+    load[rv] += tail_load_u - tail_load_v
+    dirty[ru] = dirty[rv] = True
+
+    if b != sv:
+        succ[u] = b
+        pred[b] = u
+        succ[last_v] = su
+        pred[su] = last_v
+    else:
+        succ[u] = su
+        pred[su] = u
+
+    if a != su:
+        succ[v] = a
+        pred[a] = v
+        succ[last_u] = sv
+        pred[sv] = last_u
+    else:
+        succ[v] = sv
+        pred[sv] = v
+
+
+def check_moves(route: np.ndarray, start: np.ndarray, D: np.ndarray, demands: np.ndarray, Q: int, moves: int = 10000, seed: int = 0) -> int:
+    '''Aplica movimentos aleatórios viáveis e confere, a cada movimento, a
+    variação calculada, os custos e cargas mantidos por rota e a conversão de
+    volta para rotas concatenadas contra calculate_cost e is_valid.
+
+    Returns:
+        int: número de movimentos aplicados
+
+    Raises:
+        AssertionError: na primeira divergência encontrada
+    '''
+    from utils import calculate_cost, is_valid
+    rng = np.random.default_rng(seed)
+    n = D.shape[0]
+    sol = to_linked(route, start, D, demands)
+    cost = calculate_cost(route, start, D)
+    applied = 0
+    for _ in range(moves):
+        kind = rng.integers(3)
+        # nós a partir de n são as sentinelas, inclusive de rotas vazias
+        u = rng.integers(1, n)
+        v = rng.integers(1, 2 * n - 1)
+        if kind == 0:
+            feasible, delta = relocate_delta(sol, D, demands, Q, u, v)
+            if feasible:
+                relocate(sol, D, demands, u, v)
+        elif kind == 1:
+            v = rng.integers(1, n)
+            feasible, delta = exchange_delta(sol, D, demands, Q, u, v)
+            if feasible:
+                exchange(sol, D, demands, u, v)
+        else:
+            u = rng.integers(1, 2 * n - 1)
+            feasible, delta = two_opt_star_delta(sol, D, demands, Q, u, v)
+            if feasible:
+                two_opt_star(sol, D, demands, u, v)
+        if not feasible:
+            continue
+        applied += 1
+        cost += delta
+        r, s = to_flat(sol)
+        assert is_valid(r, s, demands, Q), f'solução inválida após o movimento {kind} ({u}, {v})'
+        expected = calculate_cost(r, s, D)
+        assert abs(expected - cost) < 1e-3, f'variação incorreta no movimento {kind} ({u}, {v})'
+        assert abs(total_cost(sol) - expected) < 1e-3, f'custo por rota incorreto no movimento {kind} ({u}, {v})'
+        for q in range(n - 1):
+            members = [i for i in range(1, n) if sol[ROUTE_OF][i] == q]
+            assert sol[LOAD][q] == demands[members].sum(), f'carga incorreta no movimento {kind} ({u}, {v})'
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    from cvrp_input import prepare_input
+    from greedy import greedy
+
+    for filepath in sys.argv[1:]:
+        D, demands, Q = prepare_input(filepath)
+        route, start = greedy(D, demands, Q, 0.3)
+        print(f'{filepath}: {check_moves(route, start, D, demands, Q)} movimentos conferidos')
@@ -1,9 +1,10 @@
 import numpy as np
-from numba import njit, types
+from numba import types
+from profiling import njit
 from operators import aggregate
-from utils import calculate_cost, is_valid
+from utils import EPSILON, calculate_cost, is_valid
 
-@njit(types.Tuple((types.int32[::1], types.boolean[::1]))(types.int32[::1], types.boolean[::1], types.int32[:, ::1], types.int32[::1], types.int64))
+@njit
 def local_search(route: np.ndarray, start: np.ndarray, D: np.ndarray, demands: np.ndarray, Q: int):
     '''Encontra o ótimo local percorrendo a vizinhança da solução.
 
@@ -31,4 +32,249 @@ def local_search(route: np.ndarray, start: np.ndarray, D: np.ndarray, demands: n
                     best_cost = cost
                     best_sol = (r, s)
     
-    return best_sol
\ No newline at end of file
+    return best_sol
+
+@njit(types.UniTuple(types.int64, 2)(types.int32[::1], types.boolean[::1], types.int64))
+def neighbours(route, start, i):
+    '''Retorna os vértices anterior e seguinte ao vértice na posição i
+    (o depósito quando i está no início ou no fim da rota).
+    '''
+    prev = 0 if start[i] else route[i-1]
+    nxt = 0 if i+1 == route.shape[0] or start[i+1] else route[i+1]
+    return prev, nxt
+
+
+@njit
+def swap_delta(route, start, D, i, j):
+    '''Variação do custo ao trocar os vértices das posições i < j.
+    '''
+    u, v = route[i], route[j]
+    pi, ni = neighbours(route, start, i)
+    pj, nj = neighbours(route, start, j)
+    # vértices adjacentes na mesma rota compartilham a aresta (u, v)
+    if j == i+1 and not start[j]:
+        return D[pi, v] + D[v, u] + D[u, nj] - D[pi, u] - D[u, v] - D[v, nj]
+    return D[pi, v] + D[v, ni] + D[pj, u] + D[u, nj] - D[pi, u] - D[u, ni] - D[pj, v] - D[v, nj]
+
+
+@njit
+def two_opt_delta(route, start, D, i, j):
+    '''Variação do custo ao inverter o trecho entre as posições i < j de uma
+    mesma rota (a matriz de distâncias é simétrica, então o custo interno do
+    trecho não muda).
+    '''
+    a, _ = neighbours(route, start, i)
+    _, b = neighbours(route, start, j)
+    return D[a, route[j]] + D[route[i], b] - D[a, route[i]] - D[route[j], b]
+
+
+@njit(types.void(types.boolean[::1], types.int32[::1], types.boolean[::1], types.int64))
+def reset_bits(dont_look, route, start, i):
+    '''Reativa o vértice da posição i e seus vizinhos na rota.
+    '''
+    prev, nxt = neighbours(route, start, i)
+    dont_look[route[i]] = False
+    dont_look[prev] = False
+    dont_look[nxt] = False
+
+
+@njit
+def local_search_first(route, start, D, demands, Q):
+    '''Encontra o ótimo local aceitando o primeiro vizinho que melhora a solução.
+
+    Percorre as mesmas vizinhanças (swap e 2-opt) da busca local, avaliando
+    cada movimento pela variação do custo. Cada vértice possui um bit "don't
+    look": um vértice para o qual nenhum movimento melhora a solução é
+    ignorado até que um movimento aplicado perto dele o reative. A ordem dos
+    vértices e das vizinhanças é aleatória.
+    '''
+    route = route.copy()
+    n = route.shape[0]
+
+    # posição de cada vértice, rota de cada posição e carga de cada rota
+    pos = np.zeros(n, dtype=np.int64)
+    pos[route] = np.arange(n)
+    route_id = np.cumsum(start) - 1
+    loads = np.zeros(route_id[-1] + 1, dtype=np.int64)
+    for i in range(1, n):
+        loads[route_id[i]] += demands[route[i]]
+    route_end = np.zeros_like(loads)
+    for i in range(1, n):
+        route_end[route_id[i]] = i
+
+    dont_look = np.zeros(n, dtype=np.bool_)
+    dont_look[0] = True
+    order = np.arange(1, n)
+
+    improved = True
+    while improved:
+        improved = False
+        np.random.shuffle(order)
+        for u in order:
+            if dont_look[u]:
+                continue
+            found = False
+            i = pos[u]
+            first = np.random.randint(2)
+            for k in range(2):
+                if (first + k) % 2 == 0:
+                    # swap: troca u com o vértice de qualquer outra posição
+                    offset = np.random.randint(1, n)
+                    for step in range(n-1):
+                        j = 1 + (offset + step) % (n-1)
+                        if j == i:
+                            continue
+                        a, b = min(i, j), max(i, j)
+                        ra, rb = route_id[a], route_id[b]
+                        da = 0
+                        if ra != rb:
+                            da = demands[route[b]] - demands[route[a]]
+                            if loads[ra] + da > Q or loads[rb] - da > Q:
+                                continue
+                        if swap_delta(route, start, D, a, b) < -EPSILON:
+                            loads[ra] += da
+                            loads[rb] -= da
+                            route[a], route[b] = route[b], route[a]
+                            pos[route[a]], pos[route[b]] = a, b
+                            reset_bits(dont_look, route, start, a)
+                            reset_bits(dont_look, route, start, b)
+                            found = True
+                            break
+                else:
+                    # 2-opt: inverte um trecho da rota de u que começa ou termina em u
+                    rs = i
+                    while not start[rs]:
+                        rs -= 1
+                    re = route_end[route_id[i]]
+                    for j in range(rs, re+1):
+                        if j == i:
+                            continue
+                        a, b = min(i, j), max(i, j)
+                        if two_opt_delta(route, start, D, a, b) < -EPSILON:
+                            route[a:b+1] = route[a:b+1][::-1].copy()
+                            pos[route[a:b+1]] = np.arange(a, b+1)
+                            reset_bits(dont_look, route, start, a)
+                            reset_bits(dont_look, route, start, b)
+                            found = True
+                            break
+                if found:
+                    break
+
+            if found:
+                improved = True
+            else:
+                dont_look[u] = True
+
+    return route, start
+
+
+@njit(types.void(types.int32[::1], types.int64[::1], types.int64, types.int64, types.int64))
+def exchange_segments(tour, pos, i, j, k):
+    '''Troca de lugar os trechos consecutivos [i, j) e [j, k) da rota, sem
+    inverter nenhum deles.
+    '''
+    tour[i:k] = np.concatenate((tour[j:k], tour[i:j]))
+    for p in range(i, k):
+        pos[tour[p]] = p
+
+
+@njit
+def or_opt_move(tour, pos, D, nn):
+    '''Procura e aplica o primeiro movimento or-opt que melhora a rota.
+
+    Trechos de 1 a 3 clientes são movidos para outra posição da mesma rota.
+    Só são avaliadas posições onde o trecho fica adjacente a um dos vizinhos
+    mais próximos do seu primeiro ou último cliente.
+    '''
+    m = tour.shape[0] - 2
+    for i in range(1, m+1):
+        for L in range(1, 4):
+            if i+L-1 > m:
+                break
+            f, l = tour[i], tour[i+L-1]
+            p, q = tour[i-1], tour[i+L]
+            removal = D[p, f] + D[l, q] - D[p, q]
+            for side in range(2):
+                for c in nn[f] if side == 0 else nn[l]:
+                    if pos[c] < 0:
+                        continue
+                    # o trecho é inserido entre as posições j e j+1:
+                    # depois de c (vizinho de f) ou antes de c (vizinho de l)
+                    j = pos[c] if side == 0 else pos[c] - 1
+                    if i-1 <= j <= i+L-1:
+                        continue
+                    a, b = tour[j], tour[j+1]
+                    if D[a, f] + D[l, b] - D[a, b] - removal < -EPSILON:
+                        if j > i:
+                            exchange_segments(tour, pos, i, i+L, j+1)
+                        else:
+                            exchange_segments(tour, pos, j+1, i, i+L)
+                        return True
+    return False
+
+
+@njit
+def three_opt_move(tour, pos, D, nn):
+    '''Procura e aplica o primeiro movimento 3-opt sem inversão que melhora a rota.
+
+    Remove as arestas que entram nas posições i < j < k e troca de lugar os
+    trechos [i, j) e [j, k). O vértice que passa a seguir o da posição i-1
+    deve estar entre os seus vizinhos mais próximos.
+    '''
+    m = tour.shape[0] - 2
+    for i in range(1, m+1):
+        a = tour[i-1]
+        for c in nn[a]:
+            j = pos[c]
+            if j <= i:
+                continue
+            removed = D[a, tour[i]] + D[tour[j-1], c]
+            for k in range(j+1, m+2):
+                delta = D[a, c] + D[tour[k-1], tour[i]] + D[tour[j-1], tour[k]] - removed - D[tour[k-1], tour[k]]
+                if delta < -EPSILON:
+                    exchange_segments(tour, pos, i, j, k)
+                    return True
+    return False
+
+
+@njit
+def intra_route(route, start, D, nn):
+    '''Otimiza cada rota individualmente com or-opt e 3-opt sem inversão.
+
+    Os movimentos são avaliados pela variação do custo e restritos pelas
+    listas de vizinhos mais próximos (nn). Como não alteram os clientes de
+    cada rota, a capacidade dos veículos continua respeitada.
+    '''
+    route = route.copy()
+    pos = np.full(D.shape[0], -1, dtype=np.int64)
+    route_starts = np.argwhere(start).flatten()
+    for p in range(route_starts.shape[0]):
+        rs = route_starts[p]
+        re = route_starts[p+1] if p+1 < route_starts.shape[0] else route.shape[0]
+        # rota com o depósito nas duas pontas
+        tour = np.zeros(re - rs + 2, dtype=np.int32)
+        tour[1:-1] = route[rs:re]
+        for i in range(1, tour.shape[0] - 1):
+            pos[tour[i]] = i
+
+        while or_opt_move(tour, pos, D, nn) or three_opt_move(tour, pos, D, nn):
+            pass
+
+        route[rs:re] = tour[1:-1]
+        pos[tour[1:-1]] = -1
+    return route, start
+
+
+@njit
+def improve(route, start, D, demands, Q, first_improvement, polish, nn):
+    '''Executa a busca local escolhida: primeira melhora com bits "don't look"
+    ou melhor melhora. Se polish for verdadeiro, as rotas do ótimo local são
+    otimizadas em seguida com or-opt e 3-opt (intra_route).
+    '''
+    if first_improvement:
+        route, start = local_search_first(route, start, D, demands, Q)
+    else:
+        route, start = local_search(route, start, D, demands, Q)
+    if polish:
+        route, start = intra_route(route, start, D, nn)
+    return route, start
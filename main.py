@@ -1,7 +1,8 @@
 from cvrp_input import prepare_input
 from greedy import greedy
-from utils import calculate_cost, is_valid
+from utils import calculate_cost, batch_calculate_cost, batch_is_valid, stack_solutions
 import metaheuristics
+import archive
 from time import time
 import glob
 import pandas as pd
@@ -9,12 +10,13 @@ import pandas as pd
 
 def precompile(D, demands, Q):
     s0 = greedy(D, demands, Q, alpha=0)
-    _, _ = metaheuristics.grasp(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=1)
-    _, _ = metaheuristics.ils(s0[0], s0[1], D, demands, Q, k=1, non_improving_iter=1)
-    _, _ = metaheuristics.simulated_annealing(s0[0], s0[1], D, demands, Q, T_max=1, T_min=0.1, alpha=0.95)
-    _, _ = metaheuristics.do_tabu_search(s0[0], s0[1], D, demands, Q)
-    _, _ = metaheuristics.grasp_tabu(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=1)
-    _, _ = metaheuristics.ils_tabu(s0[0], s0[1], D, demands, Q, k=1, non_improving_iter=1)
+    _, _ = metaheuristics.grasp(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=1, target=0)
+    _, _ = metaheuristics.grasp_path_relinking(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=1, target=0)
+    _, _ = metaheuristics.ils(s0[0], s0[1], D, demands, Q, k=1, non_improving_iter=1, target=0)
+    _, _ = metaheuristics.simulated_annealing(s0[0], s0[1], D, demands, Q, T_max=1, T_min=0.1, alpha=0.95, target=0)
+    _, _ = metaheuristics.do_tabu_search(s0[0], s0[1], D, demands, Q, target=0)
+    _, _ = metaheuristics.grasp_tabu(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=1, target=0)
+    _, _ = metaheuristics.ils_tabu(s0[0], s0[1], D, demands, Q, k=1, non_improving_iter=1, target=0)
 
 
 def pre_save(filename, meta):
@@ -22,130 +24,185 @@ def pre_save(filename, meta):
     df.to_csv(f'results/{filename}.tsv', sep='\t')
 
 
-def run_mh(files: 'list[str]', do_pre_save=False, grasp=True, ils=True, simulated_annealing=True, tabu_search=True, grasp_tabu=True, ils_tabu=True, iters=1) -> 'list[dict]':
+def run_mh(files: 'list[str]', do_pre_save=False, grasp=True, grasp_path_relinking=True, ils=True, simulated_annealing=True, tabu_search=True, grasp_tabu=True, ils_tabu=True, iters=1, target_gap=0.0, archive_dir: 'str | None' = None) -> 'list[dict]':
     metadata = []
-    print('precompiling functions')
-    D, demands, Q = prepare_input(files[0])
-    t0 = time()
-    precompile(D, demands, Q)
-    t1 = time()
-    print(f'precompiling took {t1 - t0} seconds')
+    # as funções são especializadas para o tipo da matriz de distâncias, então
+    # são compiladas antes da primeira instância de cada tipo, fora das medições
+    compiled = set()
     
     for filepath in files:
         print(filepath)
-        D, demands, Q = prepare_input(filepath)
+        # valor ótimo conhecido (ou limitante inferior), as metaheurísticas
+        # param ao atingir o custo alvo dado pela folga target_gap
+        D, demands, Q, bound, bound_known = prepare_input(filepath, with_bound=True)
+        if D.dtype not in compiled:
+            print(f'precompiling functions for {D.dtype}')
+            t0 = time()
+            precompile(D, demands, Q)
+            t1 = time()
+            print(f'precompiling took {t1 - t0} seconds')
+            compiled.add(D.dtype)
+        target = int(bound * (1 + target_gap))
         for i in range(iters):
-            for alpha in [0, 0.1, 0.2, 0.3]:
+            first_row = len(metadata)
+            # com o arquivo de soluções elite, as execuções partem das melhores
+            # soluções já encontradas para a instância em vez do guloso
+            seeds = archive.best(D, demands, Q, k=4, directory=archive_dir) if archive_dir else []
+            for j, alpha in enumerate([0, 0.1, 0.2, 0.3]):
                 print((i, alpha), end=' ')
-                s0 = greedy(D, demands, Q, alpha=alpha)
+                # o guloso é sempre construído para que greedy_cost e alpha
+                # continuem comparáveis; initial_cost é o custo de onde a
+                # execução partiu (a semente do arquivo, se houver)
+                s_greedy = greedy(D, demands, Q, alpha=alpha)
+                s0 = seeds[j % len(seeds)] if seeds else s_greedy
+                greedy_cost = calculate_cost(s_greedy[0], s_greedy[1], D)
+                initial_cost = calculate_cost(s0[0], s0[1], D)
                 if grasp:
                     t0 = time()
-                    route, start = metaheuristics.grasp(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=4 * D.shape[0])
+                    route, start = metaheuristics.grasp(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=4 * D.shape[0], target=target)
                     t1 = time()
                     metadata.append({
                         'instance': filepath,
                         'n': D.shape[0],
                         'alpha': alpha,
-                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
                         'metaheuristic': 'GRASP',
                         'iteration': i,
                         'time': t1-t0,
-                        'cost': calculate_cost(route, start, D),
+                        'cost': None,
                         'route': route,
                         'start': start,
-                        'valid': is_valid(route, start, demands, Q)
+                        'valid': None
+                    })
+
+                if grasp_path_relinking:
+                    t0 = time()
+                    route, start = metaheuristics.grasp_path_relinking(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=4 * D.shape[0], target=target)
+                    t1 = time()
+                    metadata.append({
+                        'instance': filepath,
+                        'n': D.shape[0],
+                        'alpha': alpha,
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
+                        'metaheuristic': 'GRASP PR',
+                        'iteration': i,
+                        'time': t1-t0,
+                        'cost': None,
+                        'route': route,
+                        'start': start,
+                        'valid': None
                     })
 
                 if ils:
                     t0 = time()
-                    route, start = metaheuristics.ils(s0[0], s0[1], D, demands, Q, k=5, non_improving_iter=4 * D.shape[0])
+                    route, start = metaheuristics.ils(s0[0], s0[1], D, demands, Q, k=5, non_improving_iter=4 * D.shape[0], target=target)
                     t1 = time()
                     metadata.append({
                         'instance': filepath,
                         'n': D.shape[0],
                         'alpha': alpha,
-                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
                         'metaheuristic': 'ILS',
                         'iteration': i,
                         'time': t1-t0,
-                        'cost': calculate_cost(route, start, D),
+                        'cost': None,
                         'route': route,
                         'start': start,
-                        'valid': is_valid(route, start, demands, Q)
+                        'valid': None
                     })
 
                 if simulated_annealing:
                     t0 = time()
-                    route, start = metaheuristics.simulated_annealing(s0[0], s0[1], D, demands, Q, T_max=2000, T_min=0.1, alpha=0.95)
+                    route, start = metaheuristics.simulated_annealing(s0[0], s0[1], D, demands, Q, T_max=2000, T_min=0.1, alpha=0.95, target=target)
                     t1 = time()
                     metadata.append({
                         'instance': filepath,
                         'n': D.shape[0],
                         'alpha': alpha,
-                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
                         'metaheuristic': 'Simulated Annealing',
                         'iteration': i,
                         'time': t1-t0,
-                        'cost': calculate_cost(route, start, D),
+                        'cost': None,
                         'route': route,
                         'start': start,
-                        'valid': is_valid(route, start, demands, Q)
+                        'valid': None
                     })
                 
                 if tabu_search:
                     t0 = time()
-                    route, start = metaheuristics.do_tabu_search(s0[0], s0[1], D, demands, Q)
+                    route, start = metaheuristics.do_tabu_search(s0[0], s0[1], D, demands, Q, target=target)
                     t1 = time()
                     metadata.append({
                         'instance': filepath,
                         'n': D.shape[0],
                         'alpha': alpha,
-                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
                         'metaheuristic': 'Tabu Search',
                         'iteration': i,
                         'time': t1-t0,
-                        'cost': calculate_cost(route, start, D),
+                        'cost': None,
                         'route': route,
                         'start': start,
-                        'valid': is_valid(route, start, demands, Q)
+                        'valid': None
                     })
                 
                 if grasp_tabu:
                     t0 = time()
-                    route, start = metaheuristics.grasp_tabu(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=D.shape[0])
+                    route, start = metaheuristics.grasp_tabu(s0[0], s0[1], D, demands, Q, alpha=0.3, non_improving_iter=D.shape[0], target=target)
                     t1 = time()
                     metadata.append({
                         'instance': filepath,
                         'n': D.shape[0],
                         'alpha': alpha,
-                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
                         'metaheuristic': 'GRASP Tabu',
                         'iteration': i,
                         'time': t1-t0,
-                        'cost': calculate_cost(route, start, D),
+                        'cost': None,
                         'route': route,
                         'start': start,
-                        'valid': is_valid(route, start, demands, Q)
+                        'valid': None
                     })
 
                 if ils_tabu:
                     t0 = time()
-                    route, start = metaheuristics.ils_tabu(s0[0], s0[1], D, demands, Q, k=5, non_improving_iter=D.shape[0])
+                    route, start = metaheuristics.ils_tabu(s0[0], s0[1], D, demands, Q, k=5, non_improving_iter=D.shape[0], target=target)
                     t1 = time()
                     metadata.append({
                         'instance': filepath,
                         'n': D.shape[0],
                         'alpha': alpha,
-                        'greedy_cost': calculate_cost(s0[0], s0[1], D),
+                        'greedy_cost': greedy_cost,
+                        'initial_cost': initial_cost,
                         'metaheuristic': 'ILS Tabu',
                         'iteration': i,
                         'time': t1-t0,
-                        'cost': calculate_cost(route, start, D),
+                        'cost': None,
                         'route': route,
                         'start': start,
-                        'valid': is_valid(route, start, demands, Q)
+                        'valid': None
                     })
             print()
+            # custo e validade das soluções da instância calculados de uma vez
+            rows = metadata[first_row:]
+            if rows:
+                routes, starts = stack_solutions([(m['route'], m['start']) for m in rows])
+                for m, cost, valid in zip(rows, batch_calculate_cost(routes, starts, D), batch_is_valid(routes, starts, demands, Q)):
+                    m['cost'] = cost
+                    m['valid'] = valid
+                    m['bound'] = bound
+                    m['bound_known'] = bound_known
+                    m['gap'] = (cost - bound) / bound
+                    m['seeded'] = len(seeds) > 0
+                if archive_dir:
+                    archive.update(D, demands, Q, [(m['route'], m['start']) for m in rows], directory=archive_dir)
             if do_pre_save and i == iters-1:
                 pre_save(filepath[8:-4], metadata)
         
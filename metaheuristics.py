@@ -1,21 +1,27 @@
 import numpy as np
-from numba import njit
+from profiling import njit
 from greedy import greedy
-from local_search import local_search
+from local_search import local_search, improve, intra_route
 from operators import tabu_swap, tabu_two_opt
+from path_relinking import relink, update_pool
+from progress import report, cancelled
 from shaking import shake, perturb
-from utils import calculate_cost, is_valid
+from utils import calculate_cost, is_valid, nearest_neighbours
 
 @njit
-def grasp(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000):
+def grasp(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000, first_improvement=False, polish=False, K=10, target=0, progress=-1, progress_every=1):
     '''Aplica uma heurística baseada no GRASP.
 
     A cada iteração é gerada uma solução de forma semi-gulosa (controlada pelo alpha)
     e realizada uma busca local a partir desta solução. A melhor solução
-    encontrada é retornada se não houver melhora em k iterações.
+    encontrada é retornada se não houver melhora em k iterações ou se o custo
+    alvo (target) for atingido. A busca local pode ser de primeira melhora
+    (first_improvement) ou de melhor melhora, e pode ser seguida da otimização
+    intra-rota (polish) com os K vizinhos mais próximos.
     '''
+    nn = nearest_neighbours(D, K if polish else 0)
     # recebe a solução inicial nos parâmetros, preciso executar BL
-    route, start = local_search(route, start, D, demands, Q)
+    route, start = improve(route, start, D, demands, Q, first_improvement, polish, nn)
 
     # primeira e melhor solução encontrada
     best_cost = calculate_cost(route, start, D)
@@ -24,9 +30,10 @@ def grasp(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000):
     # continua iterando até que não tenha havido melhora por muitas iterações
     # critério de parada
     current_nii = 0
-    while current_nii < non_improving_iter:
+    it = 0
+    while current_nii < non_improving_iter and best_cost > target:
         route, start = greedy(D, demands, Q, alpha)
-        route, start = local_search(route, start, D, demands, Q)
+        route, start = improve(route, start, D, demands, Q, first_improvement, polish, nn)
         cost = calculate_cost(route, start, D)
         if cost < best_cost: # se for melhor que a melhor solução atual, atualiza
             current_nii = 0
@@ -34,29 +41,90 @@ def grasp(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000):
             best_sol = (route, start)
         else:
             current_nii += 1
+        it += 1
+        if progress >= 0 and it % progress_every == 0 and report(progress, it, cost, best_cost):
+            break
+
+    return best_sol
+
+
+@njit
+def grasp_path_relinking(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000, elite_size=10, min_distance=5, first_improvement=False, polish=False, K=10, target=0, progress=-1, progress_every=1):
+    '''Aplica uma heurística baseada no GRASP com reconexão por caminhos.
+
+    Mantém um conjunto elite de soluções boas e diversas. A cada iteração, o
+    ótimo local da solução semi-gulosa é reconectado a um membro aleatório do
+    conjunto elite nos dois sentidos (da solução para o membro e do membro
+    para a solução); o melhor ponto de cada caminho passa pela busca local.
+    A melhor solução obtida é candidata a entrar no conjunto elite. Para ao
+    atingir o custo alvo (target).
+    '''
+    nn = nearest_neighbours(D, K if polish else 0)
+    route, start = improve(route, start, D, demands, Q, first_improvement, polish, nn)
+
+    best_cost = calculate_cost(route, start, D)
+    best_sol = (route, start)
+    pool = [(route, start)]
+    pool_costs = [best_cost]
+
+    current_nii = 0
+    it = 0
+    while current_nii < non_improving_iter and best_cost > target:
+        route, start = greedy(D, demands, Q, alpha)
+        route, start = improve(route, start, D, demands, Q, first_improvement, polish, nn)
+        cost = calculate_cost(route, start, D)
+
+        guide_route, guide_start = pool[np.random.randint(len(pool))]
+        # forward: da solução nova para o membro do conjunto elite
+        # backward: do membro do conjunto elite para a solução nova
+        forward = relink(route, start, guide_route, guide_start, D, demands, Q)
+        backward = relink(guide_route, guide_start, route, start, D, demands, Q)
+        for r, s in [forward, backward]:
+            r, s = improve(r, s, D, demands, Q, first_improvement, polish, nn)
+            c = calculate_cost(r, s, D)
+            if c < cost:
+                route, start, cost = r, s, c
+
+        update_pool(pool, pool_costs, route, start, cost, elite_size, min_distance)
+        if cost < best_cost:
+            current_nii = 0
+            best_cost = cost
+            best_sol = (route, start)
+        else:
+            current_nii += 1
+        it += 1
+        if progress >= 0 and it % progress_every == 0 and report(progress, it, cost, best_cost):
+            break
 
     return best_sol
 
 
 @njit
-def ils(route, start, D, demands, Q, k=10, alpha=0.3, non_improving_iter=1000):
+def ils(route, start, D, demands, Q, k=10, alpha=0.3, non_improving_iter=1000, first_improvement=False, polish=False, K=10, target=0, progress=-1, progress_every=1):
     '''Aplica uma heurística baseada no ILS.
 
     A cada iteração a solução encontrada é perturbada para gerar uma nova solução.
     Esta perturbação funciona removendo k vértices aleatórios e reconstruindo a
-    solução.
+    solução. A busca local pode ser de primeira melhora (first_improvement) ou
+    de melhor melhora. Com polish, as rotas são otimizadas com or-opt e 3-opt
+    (K vizinhos mais próximos) após cada perturbação e cada busca local. Para
+    ao atingir o custo alvo (target).
     '''
-    route, start = local_search(route, start, D, demands, Q)
+    nn = nearest_neighbours(D, K if polish else 0)
+    route, start = improve(route, start, D, demands, Q, first_improvement, polish, nn)
 
     best_sol = (route, start)
     best_cost = calculate_cost(route, start, D)
 
     # critério de parada: muitas iterações sem melhora
     current_nii = 0
-    while current_nii < non_improving_iter:
+    it = 0
+    while current_nii < non_improving_iter and best_cost > target:
         # perturba a solução atual e executa BL sobre a solução perturbada
         route, start = shake(route, start, D, demands, Q, k, alpha)
-        route, start = local_search(route, start, D, demands, Q)
+        if polish:
+            route, start = intra_route(route, start, D, nn)
+        route, start = improve(route, start, D, demands, Q, first_improvement, polish, nn)
         
         # aceita qualquer solução, seja melhor que a atual ou não
 
@@ -67,18 +135,22 @@ def ils(route, start, D, demands, Q, k=10, alpha=0.3, non_improving_iter=1000):
             best_sol = (route, start)
         else:
             current_nii += 1
+        it += 1
+        if progress >= 0 and it % progress_every == 0 and report(progress, it, cost, best_cost):
+            break
     
     return best_sol
 
 
 @njit
-def simulated_annealing(route, start, D, demands, Q, T_max=5000, T_min=0.1, alpha=0.99, M=5.0, beta=1.05):
+def simulated_annealing(route, start, D, demands, Q, T_max=5000, T_min=0.1, alpha=0.99, M=5.0, beta=1.05, target=0, progress=-1, progress_every=1):
     '''Aplica uma heurística baseada no Simulated Annealing para CVRP proposta
     por Harmanani et al. (2011).
 
     Em cada temperatura são executadas M iterações (M é atualizada conforme
     valor de beta). As soluções são perturbadas e aceitas com base na diferença
-    de qualidade entre si e a solução gerada anteriormente.
+    de qualidade entre si e a solução gerada anteriormente. Para antes do
+    resfriamento completo se o custo alvo (target) for atingido.
     '''
     cost = calculate_cost(route, start, D)
 
@@ -87,10 +159,12 @@ def simulated_annealing(route, start, D, demands, Q, T_max=5000, T_min=0.1, alph
 
     # itera até que a temperatura atinja o mínimo
     T = T_max
-    while T > T_min:
+    it = 0
+    stop = False
+    while T > T_min and best_cost > target and not stop:
         # em uma temperatura iteramos M vezes
         i = M
-        while i >= 0:
+        while i >= 0 and best_cost > target:
             new_route, new_start = perturb(route, start, demands, Q)
             new_cost = calculate_cost(new_route, new_start, D)
             deltaE = new_cost - cost
@@ -100,11 +174,16 @@ def simulated_annealing(route, start, D, demands, Q, T_max=5000, T_min=0.1, alph
                 route, start, cost = new_route, new_start, new_cost
                 if cost < best_cost:
                     best_sol = (route, start)
+                    best_cost = cost
             # soluções piores são aceitas com certa probabilidade
             elif np.random.random() < np.exp(-deltaE / T):
                 route, start, cost = new_route, new_start, new_cost
             
             i -= 1
+            it += 1
+            if progress >= 0 and it % progress_every == 0 and report(progress, it, cost, best_cost):
+                stop = True
+                break
         # diminui a temperatura e aumenta M
         T *= alpha
         M *= beta
@@ -112,12 +191,14 @@ def simulated_annealing(route, start, D, demands, Q, T_max=5000, T_min=0.1, alph
     return best_sol
 
 @njit
-def tabu_search(route, start, D, demands, Q, T, Kmax):
+def tabu_search(route, start, D, demands, Q, T, Kmax, target=0, progress=-1):
     '''Aplica uma heurística baseada na Busca Tabu, segundo a proposta de
     Oliveira et al. (2020).
 
     Nesta abordagem um movimento permanece na lista tabu por T iterações e
-    o critério de parada são Kmax iterações sem melhora.
+    o critério de parada são Kmax iterações sem melhora ou atingir o custo
+    alvo (target). A busca é usada dentro de outras metaheurísticas, então
+    apenas verifica o cancelamento; o progresso é relatado por quem a chama.
     '''
     best_sol = (route, start)
     best_cost = calculate_cost(route, start, D)
@@ -126,7 +207,7 @@ def tabu_search(route, start, D, demands, Q, T, Kmax):
 
     next_cost = np.inf
 
-    while k < Kmax:
+    while k < Kmax and best_cost > target:
         k += 1
         # gera a vizinhança usando swap e 2-opt
         N = tabu_swap(route, start) + tabu_two_opt(route, start)
@@ -156,86 +237,122 @@ def tabu_search(route, start, D, demands, Q, T, Kmax):
         
         # adiciona na lista tabu o movimento realizado
         tabu_list[movement] = T
+
+        if cancelled(progress):
+            break
     
     return best_sol
 
 @njit
-def do_tabu_search(route, start, D, demands, Q):
+def do_tabu_search(route, start, D, demands, Q, target=0, progress=-1, progress_every=1):
     '''Seguindo a proposta de Oliveira et al. (2020), executa a BT três vezes
     em sequência, cada vez com um valor diferente para a lista tabu para o critério
-    de parada.
+    de parada. O progresso é relatado ao fim de cada uma das três buscas.
     '''
     n = D.shape[0]
     route, start = local_search(route, start, D, demands, Q)
-
-    # movimentos na lista tabu ficarão por n/3 iterações
-    # para após 4n iterações sem melhora
-    route, start = tabu_search(route, start, D, demands, Q, n // 3, 4 * n)
-
-    # movimentos na lista tabu ficarão por n/6 iterações
-    # para após 2n iterações sem melhora
-    route, start = tabu_search(route, start, D, demands, Q, n // 6, 2 * n)
-
-    # movimentos na lista tabu ficarão por n²/100 iterações
-    # para após n iterações sem melhora
-    route, start = tabu_search(route, start, D, demands, Q, n**2 // 100, n)
+    cost = calculate_cost(route, start, D)
+    if progress >= 0 and report(progress, 0, cost, cost):
+        return route, start
+
+    # movimentos na lista tabu ficarão por n/3, n/6 e n²/100 iterações
+    # e cada busca para após 4n, 2n e n iterações sem melhora
+    # (cada busca parte da melhor solução da anterior)
+    for it, (T, Kmax) in enumerate([(n // 3, 4 * n), (n // 6, 2 * n), (n**2 // 100, n)]):
+        route, start = tabu_search(route, start, D, demands, Q, T, Kmax, target, progress)
+        if cancelled(progress):
+            break
+        cost = calculate_cost(route, start, D)
+        if progress >= 0 and (it + 1) % progress_every == 0 and report(progress, it + 1, cost, cost):
+            break
 
     return route, start
 
 # hybrid
 
 @njit
-def grasp_tabu(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000):
+def grasp_tabu(route, start, D, demands, Q, alpha=0.3, non_improving_iter=1000, target=0, progress=-1, progress_every=1):
     '''Aplica uma heurística baseada no GRASP utilizando a busca tabu como
-    forma de explorar a vizinhança.
+    forma de explorar a vizinhança. Para ao atingir o custo alvo (target).
     '''
     # movimentos na lista tabu ficarão por n/3 iterações
     # para após 4n iterações sem melhora
-    route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0])
+    cost = calculate_cost(route, start, D)
+    if progress >= 0 and report(progress, 0, cost, cost):
+        return route, start
+    route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0], target, progress)
     best_cost = calculate_cost(route, start, D)
     best_sol = (route, start)
+    if cancelled(progress):
+        return best_sol
 
     current_nii = 0
-    while current_nii < non_improving_iter:
+    it = 0
+    while current_nii < non_improving_iter and best_cost > target:
         route, start = greedy(D, demands, Q, alpha)
         # movimentos na lista tabu ficarão por n/3 iterações
         # para após 4n iterações sem melhora
-        route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0])
+        route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0], target, progress)
         cost = calculate_cost(route, start, D)
+        if cancelled(progress):
+            if cost < best_cost:
+                best_sol = (route, start)
+            break
         if cost < best_cost:
             current_nii = 0
             best_cost = cost
             best_sol = (route, start)
         else:
             current_nii += 1
+        it += 1
+        if progress >= 0 and it % progress_every == 0 and report(progress, it, cost, best_cost):
+            break
 
     return best_sol
 
 
 @njit
-def ils_tabu(route, start, D, demands, Q, k=10, alpha=0.3, non_improving_iter=1000):
+def ils_tabu(route, start, D, demands, Q, k=10, alpha=0.3, non_improving_iter=1000, polish=False, K=10, target=0, progress=-1, progress_every=1):
     '''Aplica uma heurística baseada no ILS utilizando a busca tabu como forma
-    de explorar a vizinhança.
+    de explorar a vizinhança. Com polish, as rotas são otimizadas com or-opt e
+    3-opt (K vizinhos mais próximos) após cada perturbação. Para ao atingir o
+    custo alvo (target).
     '''
+    nn = nearest_neighbours(D, K if polish else 0)
     # movimentos na lista tabu ficarão por n/3 iterações
     # para após 4n iterações sem melhora
-    route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0])
+    cost = calculate_cost(route, start, D)
+    if progress >= 0 and report(progress, 0, cost, cost):
+        return route, start
+    route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0], target, progress)
 
     best_sol = (route, start)
     best_cost = calculate_cost(route, start, D)
+    if cancelled(progress):
+        return best_sol
 
     current_nii = 0
-    while current_nii < non_improving_iter:
+    it = 0
+    while current_nii < non_improving_iter and best_cost > target:
         route, start = shake(route, start, D, demands, Q, k, alpha)
+        if polish:
+            route, start = intra_route(route, start, D, nn)
         # movimentos na lista tabu ficarão por n/3 iterações
         # para após 4n iterações sem melhora
-        route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0])
+        route, start = tabu_search(route, start, D, demands, Q, D.shape[0] // 3, 4 * D.shape[0], target, progress)
         cost = calculate_cost(route, start, D)
+        if cancelled(progress):
+            if cost < best_cost:
+                best_sol = (route, start)
+            break
         if cost < best_cost:
             current_nii = 0
             best_cost = cost
             best_sol = (route, start)
         else:
             current_nii += 1
+        it += 1
+        if progress >= 0 and it % progress_every == 0 and report(progress, it, cost, best_cost):
+            break
     
     return best_sol
\ No newline at end of file
@@ -1,5 +1,6 @@
 import numpy as np
-from numba import njit, types
+from numba import types
+from profiling import njit
 
 @njit((types.int32[::1], types.boolean[::1]))
 def swap(route: np.ndarray, start: np.ndarray):
@@ -0,0 +1,165 @@
+import numpy as np
+from numba import types
+from profiling import njit
+from local_search import swap_delta
+from utils import calculate_cost
+
+@njit(types.int64(types.int32[::1], types.boolean[::1], types.int32[::1], types.boolean[::1]))
+def solution_distance(route_a, start_a, route_b, start_b):
+    '''Calcula a distância entre duas soluções como o número de arestas da
+    solução a que não existem na solução b, com as arestas repetidas contadas
+    uma vez para cada ocorrência. A distância é zero apenas para soluções com
+    as mesmas arestas, em qualquer ordem dos argumentos.
+
+    Diferente de comparar os vetores posição a posição, essa distância não
+    depende da ordem em que as rotas aparecem no vetor.
+    '''
+    n = route_a.shape[0]
+    # sucessor e predecessor de cada cliente em b (0 quando a aresta vai ao
+    # depósito) e número de arestas entre cada cliente e o depósito em b
+    succ = np.zeros(n, dtype=np.int64)
+    pred = np.zeros(n, dtype=np.int64)
+    depot = np.zeros(n, dtype=np.int64)
+    for i in range(1, n):
+        if start_b[i]:
+            depot[route_b[i]] += 1
+        else:
+            pred[route_b[i]] = route_b[i-1]
+        if i+1 == n or start_b[i+1]:
+            depot[route_b[i]] += 1
+        else:
+            succ[route_b[i]] = route_b[i+1]
+
+    distance = 0
+    for i in range(1, n):
+        u = route_a[i]
+        # arestas com o depósito são consumidas conforme são encontradas, já
+        # que uma rota com um só cliente tem duas arestas iguais
+        if start_a[i]:
+            if depot[u] > 0:
+                depot[u] -= 1
+            else:
+                distance += 1
+        if i+1 == n or start_a[i+1]:
+            if depot[u] > 0:
+                depot[u] -= 1
+            else:
+                distance += 1
+        # a aresta (u, v) existe em b em qualquer um dos sentidos
+        elif succ[u] != route_a[i+1] and pred[u] != route_a[i+1]:
+            distance += 1
+    return distance
+
+
+@njit(types.Tuple((types.int64[::1], types.int64[::1]))(types.int32[::1], types.boolean[::1], types.int32[::1]))
+def route_loads(route, start, demands):
+    '''Calcula a rota de cada posição do vetor e a carga de cada rota.
+    '''
+    route_id = np.cumsum(start) - 1
+    loads = np.zeros(route_id[-1] + 1, dtype=np.int64)
+    for i in range(1, route.shape[0]):
+        loads[route_id[i]] += demands[route[i]]
+    return route_id, loads
+
+
+@njit
+def relink(route, start, guide_route, guide_start, D, demands, Q):
+    '''Percorre o caminho entre a solução inicial e a solução guia.
+
+    A cada passo é aplicado o movimento viável de menor variação de custo
+    entre os que aproximam a solução da guia: trocar dois vértices para que
+    uma posição passe a ter o vértice da guia, ou criar/desfazer um início de
+    rota que difere da guia. Retorna a melhor solução intermediária do
+    caminho (a solução inicial, caso não haja nenhuma).
+    '''
+    route = route.copy()
+    start = start.copy()
+    n = route.shape[0]
+    pos = np.zeros(n, dtype=np.int64)
+    pos[route] = np.arange(n)
+
+    cost = calculate_cost(route, start, D)
+    best_sol = (route.copy(), start.copy())
+    best_cost = np.iinfo(np.int64).max
+
+    while True:
+        route_id, loads = route_loads(route, start, demands)
+        best_delta = np.iinfo(np.int64).max
+        move, mi, mj = -1, 0, 0
+        for i in range(1, n):
+            if route[i] != guide_route[i]:
+                # swap que coloca na posição i o vértice da guia
+                j = pos[guide_route[i]]
+                a, b = min(i, j), max(i, j)
+                ra, rb = route_id[a], route_id[b]
+                da = demands[route[b]] - demands[route[a]]
+                if ra == rb or (loads[ra] + da <= Q and loads[rb] - da <= Q):
+                    delta = swap_delta(route, start, D, a, b)
+                    if delta < best_delta:
+                        best_delta, move, mi, mj = delta, 0, a, b
+            if start[i] != guide_start[i]:
+                u, prev = route[i], route[i-1]
+                if start[i]:
+                    # une a rota iniciada em i com a anterior
+                    if loads[route_id[i] - 1] + loads[route_id[i]] > Q:
+                        continue
+                    delta = D[prev, u] - D[prev, 0] - D[0, u]
+                else:
+                    # divide a rota, iniciando uma nova em i
+                    delta = D[prev, 0] + D[0, u] - D[prev, u]
+                if delta < best_delta:
+                    best_delta, move, mi, mj = delta, 1, i, i
+
+        # nenhum movimento viável, o caminho termina aqui
+        if move == -1:
+            break
+
+        if move == 0:
+            route[mi], route[mj] = route[mj], route[mi]
+            pos[route[mi]], pos[route[mj]] = mi, mj
+        else:
+            start[mi] = not start[mi]
+        cost += best_delta
+
+        # chegou na solução guia
+        if np.all(route == guide_route) and np.all(start == guide_start):
+            break
+
+        if cost < best_cost:
+            best_cost = cost
+            best_sol = (route.copy(), start.copy())
+
+    return best_sol
+
+
+@njit
+def update_pool(pool, pool_costs, route, start, cost, elite_size, min_distance):
+    '''Tenta inserir uma solução no conjunto elite.
+
+    Enquanto o conjunto não está cheio, qualquer solução diferente das
+    existentes é aceita. Depois, a solução entra se for a melhor do conjunto
+    ou se for melhor que a pior e estiver a pelo menos min_distance arestas de
+    todas; ela substitui o membro mais parecido dentre os piores que ela.
+    '''
+    closest = -1
+    closest_distance = np.iinfo(np.int64).max
+    min_found = np.iinfo(np.int64).max
+    for p in range(len(pool)):
+        distance = solution_distance(route, start, pool[p][0], pool[p][1])
+        min_found = min(min_found, distance)
+        if pool_costs[p] > cost and distance < closest_distance:
+            closest, closest_distance = p, distance
+
+    if min_found == 0:
+        return False
+    if len(pool) < elite_size:
+        pool.append((route, start))
+        pool_costs.append(cost)
+        return True
+    if closest == -1:
+        return False
+    if cost < min(pool_costs) or min_found >= min_distance:
+        pool[closest] = (route, start)
+        pool_costs[closest] = cost
+        return True
+    return False
@@ -0,0 +1,284 @@
+import inspect
+import os
+import sys
+import numba
+import numpy as np
+from llvmlite import ir
+from numba import carray, types
+from numba.core import cgutils
+from numba.extending import intrinsic
+from time import perf_counter
+
+# Modo de perfil das funções compiladas.
+#
+# Os perfiladores de Python enxergam cada chamada a uma função compilada como
+# um único quadro opaco. Com a variável de ambiente CVRP_PROFILE=1 definida
+# antes da importação dos módulos, o njit deste módulo envolve cada função em
+# outra função compilada que conta a chamada e o tempo gasto (pelo contador de
+# ciclos do processador) no nó correspondente da árvore de chamadas. Tudo é
+# feito sem sair do código compilado, em um único vetor de estado. Sem a
+# variável, njit é o próprio numba.njit e não há custo algum.
+#
+# No modo de perfil as funções paralelas são compiladas em série, já que a
+# árvore de chamadas não é compartilhada entre threads.
+
+ENABLED = os.environ.get('CVRP_PROFILE', '') not in ('', '0')
+
+MAX_KERNELS = 128
+MAX_NODES = 4096
+MAX_DEPTH = 256
+
+# disposição do vetor de estado
+DEPTH, NODES = 0, 1
+KERNEL = 2
+PARENT = KERNEL + MAX_NODES
+CALLS = PARENT + MAX_NODES
+TICKS = CALLS + MAX_NODES
+CHILDREN = TICKS + MAX_NODES
+STACK_NODE = CHILDREN + MAX_NODES * MAX_KERNELS
+STACK_START = STACK_NODE + MAX_DEPTH
+SIZE = STACK_START + MAX_DEPTH
+
+_state = np.zeros(SIZE, dtype=np.int64)
+_kernels = []
+
+# custo da instrumentação em ciclos, descontado nos relatórios (ver
+# calibrate): _inside é a parte medida pela própria chamada e _overhead o
+# custo total de uma chamada instrumentada para quem a chama
+_inside = 0.0
+_overhead = 0.0
+_ticks_per_second = 0.0
+
+
+@intrinsic
+def _clock(typingctx):
+    def codegen(context, builder, signature, args):
+        fn = cgutils.get_or_insert_function(builder.module, ir.FunctionType(ir.IntType(64), []), 'llvm.readcyclecounter')
+        return builder.call(fn, [])
+    return types.int64(), codegen
+
+
+@intrinsic
+def _pointer(typingctx, address):
+    def codegen(context, builder, signature, args):
+        return builder.inttoptr(args[0], context.get_value_type(signature.return_type))
+    return types.CPointer(types.int64)(types.int64), codegen
+
+
+@numba.njit(types.void(types.int64, types.int64))
+def _push(address, kernel):
+    state = carray(_pointer(address), SIZE)
+    depth = state[DEPTH]
+    node = state[STACK_NODE + depth]
+    child = state[CHILDREN + node * MAX_KERNELS + kernel]
+    if child == 0:
+        # novo nó da árvore; com a árvore cheia o tempo fica com o nó atual
+        child = node
+        if state[NODES] < MAX_NODES:
+            child = state[NODES]
+            state[NODES] += 1
+            state[KERNEL + child] = kernel
+            state[PARENT + child] = node
+            state[CHILDREN + node * MAX_KERNELS + kernel] = child
+    depth = min(depth + 1, MAX_DEPTH - 1)
+    state[DEPTH] = depth
+    state[STACK_NODE + depth] = child
+    state[STACK_START + depth] = _clock()
+
+
+@numba.njit(types.void(types.int64))
+def _pop(address):
+    now = _clock()
+    state = carray(_pointer(address), SIZE)
+    depth = state[DEPTH]
+    node = state[STACK_NODE + depth]
+    state[CALLS + node] += 1
+    state[TICKS + node] += now - state[STACK_START + depth]
+    state[DEPTH] = depth - 1
+
+
+@numba.njit(types.int64())
+def _ticks():
+    return _clock()
+
+
+def reset():
+    '''Descarta as medições feitas até aqui.
+    '''
+    _state[:] = 0
+    _state[NODES] = 1
+
+
+reset()
+
+
+def _instrument(func, dispatcher_args: tuple, dispatcher_kwargs: dict):
+    '''Compila a função e a envolve em uma função compilada instrumentada com
+    a mesma lista de parâmetros (e os mesmos valores padrão).
+    '''
+    dispatcher_kwargs = {k: v for k, v in dispatcher_kwargs.items() if k != 'parallel'}
+    inner = numba.njit(*dispatcher_args, **dispatcher_kwargs)(func)
+    if len(_kernels) == MAX_KERNELS:
+        return inner
+    kernel = len(_kernels)
+    _kernels.append(f'{func.__module__}.{func.__name__}')
+
+    parameters = inspect.signature(func).parameters.values()
+    params = ', '.join(p.name if p.default is inspect.Parameter.empty else f'{p.name}={p.default!r}' for p in parameters)
+    args = ', '.join(p.name for p in parameters)
+    source = (
+        f'def {func.__name__}({params}):\n'
+        f'    _push({_state.ctypes.data}, {kernel})\n'
+        f'    result = _inner({args})\n'
+        f'    _pop({_state.ctypes.data})\n'
+        f'    return result\n'
+    )
+    namespace = {'_push': _push, '_pop': _pop, '_inner': inner}
+    exec(source, namespace)
+    wrapper = namespace[func.__name__]
+    wrapper.__doc__ = func.__doc__
+    # assinaturas explícitas continuam sendo compiladas na importação
+    signatures = dispatcher_args[:1] if dispatcher_args and not callable(dispatcher_args[0]) else ()
+    return numba.njit(*signatures, **dispatcher_kwargs)(wrapper)
+
+
+def njit(*args, **kwargs):
+    '''Substituto de numba.njit que instrumenta a função no modo de perfil.
+
+    Aceita as mesmas formas de uso: @njit, @njit(assinatura) e
+    @njit(assinatura, parallel=True).
+    '''
+    if not ENABLED:
+        return numba.njit(*args, **kwargs)
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return _instrument(args[0], (), {})
+    return lambda func: _instrument(func, args, kwargs)
+
+
+def calibrate(samples: int = 1000000, repeats: int = 5) -> 'tuple[float, float]':
+    '''Mede a frequência do contador de ciclos e o custo da instrumentação,
+    chamando uma função vazia de dentro de um laço compilado (o menor de
+    repeats medições). A partir daí esse custo é descontado nos relatórios.
+    Descarta as medições feitas até aqui.
+
+    Returns:
+        tuple[float, float]: custo medido dentro da chamada e custo total da
+        chamada, em segundos
+    '''
+    global _inside, _overhead, _ticks_per_second
+    t0, c0 = perf_counter(), _ticks()
+    while perf_counter() - t0 < 0.1:
+        pass
+    _ticks_per_second = (_ticks() - c0) / (perf_counter() - t0)
+
+    def noop():
+        return 0
+    noop.__module__ = __name__
+    instrumented = _instrument(noop, (), {})
+
+    def loop(samples):
+        for _ in range(samples):
+            instrumented()
+        return 0
+    loop.__module__ = __name__
+    looped = _instrument(loop, (), {})
+
+    looped(1)
+    inside, total = [], []
+    for _ in range(repeats):
+        reset()
+        looped(samples)
+        # nó 1: loop, nó 2: noop
+        inside.append(_state[TICKS + 2] / _state[CALLS + 2])
+        total.append(_state[TICKS + 1] / samples)
+    reset()
+    _inside, _overhead = min(inside), min(total)
+    return _inside / _ticks_per_second, _overhead / _ticks_per_second
+
+
+def _tree() -> 'list[dict]':
+    '''Converte o vetor de estado em uma lista de nós da árvore de chamadas,
+    com os tempos em segundos já descontado o custo da instrumentação.
+    '''
+    if _ticks_per_second == 0:
+        raise RuntimeError('calibrate deve ser chamada antes das medições')
+    n = int(_state[NODES])
+    kernel = _state[KERNEL:KERNEL + n]
+    parent = _state[PARENT:PARENT + n]
+    calls = _state[CALLS:CALLS + n].astype(np.float64)
+    ticks = _state[TICKS:TICKS + n].astype(np.float64)
+
+    # os filhos são sempre criados depois dos pais
+    descendants = np.zeros(n)
+    for node in range(n - 1, 0, -1):
+        descendants[parent[node]] += descendants[node] + calls[node]
+    total = np.maximum(ticks - calls * _inside - descendants * _overhead, 0)
+    children = np.zeros(n)
+    for node in range(n - 1, 0, -1):
+        children[parent[node]] += total[node]
+
+    nodes = [None] * n
+    for node in range(1, n):
+        name = _kernels[kernel[node]]
+        path = nodes[parent[node]]['path'] + (name,) if parent[node] else (name,)
+        nodes[node] = {
+            'path': path,
+            'calls': int(calls[node]),
+            'total_time': total[node] / _ticks_per_second,
+            'self_time': max(total[node] - children[node], 0) / _ticks_per_second,
+        }
+    return nodes[1:]
+
+
+def stats() -> 'list[dict]':
+    '''Retorna, para cada função, o número de chamadas, o tempo total
+    (incluindo as funções chamadas) e o tempo próprio, em segundos.
+    '''
+    kernels = {}
+    for node in _tree():
+        name = node['path'][-1]
+        k = kernels.setdefault(name, {'kernel': name, 'calls': 0, 'total_time': 0.0, 'self_time': 0.0})
+        k['calls'] += node['calls']
+        k['self_time'] += node['self_time']
+        # chamadas recursivas não são contadas duas vezes no tempo total
+        if name not in node['path'][:-1]:
+            k['total_time'] += node['total_time']
+    return sorted(kernels.values(), key=lambda k: -k['total_time'])
+
+
+def export_collapsed(path: str, unit: float = 1e-6):
+    '''Escreve o tempo próprio de cada pilha de chamadas no formato
+    "a;b;c valor" (pilhas colapsadas), lido por flamegraph.pl, speedscope e
+    inferno. Os valores são inteiros em unidades de unit segundos.
+    '''
+    with open(path, 'w') as f:
+        for node in sorted(_tree(), key=lambda node: node['path']):
+            value = int(round(node['self_time'] / unit))
+            if value > 0:
+                f.write(f'{";".join(node["path"])} {value}\n')
+
+
+if __name__ == '__main__':
+    if not ENABLED:
+        sys.exit('uso: CVRP_PROFILE=1 python profiling.py <instância.vrp> [metaheurística]')
+    import pandas as pd
+    import profiling
+    import metaheuristics
+    from cvrp_input import prepare_input
+    from greedy import greedy
+
+    filepath = sys.argv[1]
+    name = sys.argv[2] if len(sys.argv) > 2 else 'ils'
+    D, demands, Q = prepare_input(filepath)
+    route, start = greedy(D, demands, Q, 0)
+    # a primeira execução apenas compila as funções
+    getattr(metaheuristics, name)(route, start, D, demands, Q)
+    profiling.calibrate()
+    t0 = perf_counter()
+    getattr(metaheuristics, name)(route, start, D, demands, Q)
+    print(f'{name}: {perf_counter() - t0:.3f} s')
+
+    os.makedirs('results', exist_ok=True)
+    instance = os.path.splitext(os.path.basename(filepath))[0]
+    profiling.export_collapsed(f'results/profile_{instance}_{name}.folded')
+    print(pd.DataFrame(profiling.stats()).to_string(index=False))
@@ -0,0 +1,168 @@
+import numpy as np
+from numba import carray, njit, objmode
+from time import perf_counter, sleep, time
+from profiling import _clock, _pointer, _ticks
+
+# Acompanhamento das metaheurísticas durante a execução.
+#
+# As funções compiladas não recebem objetos Python, então cada callback é
+# registrado aqui e as metaheurísticas recebem apenas o seu identificador
+# (progress). Com progress = -1 (padrão) nenhum relatório é feito e o custo é
+# só uma comparação por iteração.
+#
+# O intervalo entre chamadas do callback é verificado dentro do código
+# compilado: para cada identificador, o vetor de estado guarda o instante
+# (no contador de ciclos do processador) a partir do qual o callback pode ser
+# chamado de novo e se a execução foi cancelada. Só então a execução passa
+# pelo interpretador (objmode), então relatar a cada iteração custa apenas a
+# leitura do contador.
+#
+# As buscas internas das metaheurísticas híbridas apenas consultam cancelled;
+# os relatórios vêm do laço externo, com o melhor custo global. Durante uma
+# busca interna longa, cancelled repete ao callback o último relatório (com o
+# tempo atualizado), para que ele continue podendo interromper a execução.
+
+MAX_HANDLES = 1024
+
+# disposição do vetor de estado
+DEADLINE = 0
+CANCELLED = MAX_HANDLES
+SIZE = 2 * MAX_HANDLES
+
+_state = np.zeros(SIZE, dtype=np.int64)
+_ADDRESS = _state.ctypes.data
+_ticks_per_second = 0.0
+
+
+class Hook:
+    def __init__(self, callback, interval: float):
+        self.callback = callback
+        self.interval = interval
+        self.t0 = time()
+        self.last = -interval
+        self.cancelled = False
+        self.info = None
+
+
+_hooks = {}
+
+
+def _calibrate():
+    '''Mede a frequência do contador de ciclos. Se o contador não estiver
+    disponível, o intervalo é verificado apenas no interpretador.
+    '''
+    global _ticks_per_second
+    t0, c0 = perf_counter(), _ticks()
+    sleep(0.02)
+    _ticks_per_second = max((_ticks() - c0) / (perf_counter() - t0), 0.0)
+
+
+def register(callback, interval: float = 1.0) -> int:
+    '''Registra um callback de progresso e retorna o identificador a ser
+    passado às metaheurísticas (parâmetro progress).
+
+    O callback recebe um dicionário com iteration, cost, best_cost e elapsed
+    e é chamado no máximo uma vez a cada interval segundos. Se retornar True a
+    execução é cancelada: a metaheurística para e retorna a melhor solução
+    encontrada até então.
+
+    Raises:
+        RuntimeError: se já houver MAX_HANDLES callbacks registrados
+    '''
+    if _ticks_per_second == 0:
+        _calibrate()
+    handle = next((h for h in range(MAX_HANDLES) if h not in _hooks), None)
+    if handle is None:
+        raise RuntimeError(f'mais de {MAX_HANDLES} callbacks registrados')
+    _hooks[handle] = Hook(callback, interval)
+    _state[DEADLINE + handle] = 0
+    _state[CANCELLED + handle] = 0
+    return handle
+
+
+def unregister(handle: int):
+    _hooks.pop(handle, None)
+
+
+def cancel(handle: int):
+    '''Pede o cancelamento da execução associada ao identificador.
+    '''
+    if handle in _hooks:
+        _hooks[handle].cancelled = True
+        _state[CANCELLED + handle] = 1
+
+
+def _call(handle: int, hook: Hook, now: float):
+    '''Chama o callback, se o intervalo já passou, e atualiza o vetor de
+    estado com o próximo instante permitido e o cancelamento.
+    '''
+    remaining = hook.last + hook.interval - now
+    if not hook.cancelled and remaining <= 0:
+        hook.last = now
+        remaining = hook.interval
+        if hook.callback({**hook.info, 'elapsed': now - hook.t0}):
+            hook.cancelled = True
+    _state[DEADLINE + handle] = _ticks() + int(remaining * _ticks_per_second)
+    _state[CANCELLED + handle] = hook.cancelled
+
+
+def _dispatch(handle: int, iteration: int, cost: float, best_cost: float) -> bool:
+    hook = _hooks.get(handle)
+    if hook is None:
+        return False
+    now = time()
+    if not hook.cancelled and now - hook.last >= hook.interval:
+        hook.info = {'iteration': iteration, 'cost': cost, 'best_cost': best_cost}
+    _call(handle, hook, now)
+    return hook.cancelled
+
+
+def _poll(handle: int) -> bool:
+    hook = _hooks.get(handle)
+    if hook is None:
+        return False
+    if hook.info is not None:
+        _call(handle, hook, time())
+    return hook.cancelled
+
+
+@njit
+def _wait(progress):
+    '''Verifica, sem sair do código compilado, se a execução foi cancelada
+    (1), se o intervalo do callback ainda não passou (0) ou se é preciso
+    passar pelo interpretador (-1).
+    '''
+    state = carray(_pointer(_ADDRESS), SIZE)
+    if state[CANCELLED + progress]:
+        return 1
+    if _clock() < state[DEADLINE + progress]:
+        return 0
+    return -1
+
+
+@njit
+def report(progress, iteration, cost, best_cost):
+    '''Relata o progresso ao callback registrado e retorna se a execução deve
+    parar. Deve ser chamada apenas com progress >= 0.
+    '''
+    wait = _wait(progress)
+    if wait >= 0:
+        return wait == 1
+    with objmode(stop='boolean'):
+        stop = _dispatch(progress, iteration, float(cost), float(best_cost))
+    return stop
+
+
+@njit
+def cancelled(progress):
+    '''Retorna se o cancelamento da execução foi pedido, repetindo o último
+    relatório ao callback se o intervalo já passou.
+    '''
+    if progress < 0:
+        return False
+    wait = _wait(progress)
+    if wait >= 0:
+        return wait == 1
+    with objmode(stop='boolean'):
+        stop = _poll(progress)
+    return stop
@@ -0,0 +1,239 @@
+import numpy as np
+from numba import types
+from profiling import njit
+from time import time
+from cvrp_input import distance_dtype
+from local_search import improve
+from shaking import shake
+from utils import calculate_cost, nearest_neighbours
+
+
+def update_instance(D: np.ndarray, demands: np.ndarray, coords: np.ndarray, changes: dict) -> 'tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]':
+    '''Aplica um conjunto de alterações à instância.
+
+    Clientes removidos saem da matriz de distâncias e os demais são
+    renumerados; apenas as linhas e colunas dos clientes adicionados são
+    calculadas.
+
+    Args:
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        coords (np.ndarray): posições (x, y) de cada nó
+        changes (dict): alterações, com as chaves opcionais 'add' (lista de
+            (x, y, demanda) dos novos clientes), 'remove' (lista de clientes
+            cancelados) e 'demands' (dicionário cliente -> nova demanda)
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: matriz de
+        distâncias, vetor de demandas e coordenadas atualizados, e o novo
+        índice de cada nó antigo (-1 para os removidos)
+    '''
+    n = D.shape[0]
+    demands = demands.copy()
+    for node, demand in changes.get('demands', {}).items():
+        demands[node] = demand
+
+    removed = np.zeros(n, dtype=bool)
+    removed[list(changes.get('remove', []))] = True
+    removed[0] = False
+    keep = np.argwhere(~removed).flatten()
+    mapping = np.full(n, -1, dtype=np.int32)
+    mapping[keep] = np.arange(keep.shape[0])
+
+    added = changes.get('add', [])
+    m = keep.shape[0] + len(added)
+    rounded = D.dtype.kind == 'i'
+    new_coords = np.concatenate((coords[keep], np.array([(x, y) for x, y, _ in added]).reshape(-1, 2)))
+    new_demands = np.concatenate((demands[keep], [d for _, _, d in added])).astype(demands.dtype)
+    new_rows = np.zeros((m - keep.shape[0], m))
+    for j in range(keep.shape[0], m):
+        delta = new_coords - new_coords[j]
+        new_rows[j - keep.shape[0]] = np.sqrt((delta ** 2).sum(axis=1))
+    if rounded:
+        new_rows = np.rint(new_rows)
+
+    # clientes novos distantes podem exigir um tipo maior que o atual
+    dtype = np.promote_types(D.dtype, distance_dtype(new_rows.max(initial=0), rounded))
+    new_D = np.zeros((m, m), dtype=dtype)
+    new_D[:keep.shape[0], :keep.shape[0]] = D[np.ix_(keep, keep)]
+    new_D[keep.shape[0]:, :] = new_rows
+    new_D[:, keep.shape[0]:] = new_rows.T
+
+    return new_D, new_demands, new_coords, mapping
+
+
+@njit(types.Tuple((types.int32[::1], types.boolean[::1]))(types.int32[::1], types.boolean[::1], types.boolean[::1]))
+def compact(route, start, keep):
+    '''Remove da solução as posições não marcadas em keep.
+
+    O início de rota de uma posição removida passa para o próximo vértice
+    mantido da mesma rota; rotas que ficam vazias desaparecem.
+    '''
+    new_route = np.zeros(keep.sum(), dtype=np.int32)
+    new_start = np.zeros(keep.sum(), dtype=np.bool_)
+    j = 1
+    pending = False
+    for i in range(1, route.shape[0]):
+        pending = pending or start[i]
+        if keep[i]:
+            new_route[j] = route[i]
+            new_start[j] = pending
+            pending = False
+            j += 1
+    return new_route, new_start
+
+
+@njit
+def eject_overloaded(route, start, D, demands, Q):
+    '''Retira clientes das rotas cuja carga excede a capacidade.
+
+    Em cada rota sobrecarregada são removidos, um a um, os clientes cuja
+    remoção mais reduz o custo da rota, até que a capacidade seja respeitada.
+
+    Returns:
+        tuple: solução sem os clientes retirados e o vetor dos clientes retirados
+    '''
+    n = route.shape[0]
+    keep = np.ones(n, dtype=np.bool_)
+    route_starts = np.argwhere(start).flatten()
+    for p in range(route_starts.shape[0]):
+        rs = route_starts[p]
+        re = route_starts[p+1] if p+1 < route_starts.shape[0] else n
+        load = demands[route[rs:re]].sum()
+        while load > Q:
+            best_i, best_saving = -1, np.iinfo(np.int64).min
+            prev = 0
+            for i in range(rs, re):
+                if not keep[i]:
+                    continue
+                nxt = 0
+                for j in range(i+1, re):
+                    if keep[j]:
+                        nxt = route[j]
+                        break
+                saving = D[prev, route[i]] + D[route[i], nxt] - D[prev, nxt]
+                if saving > best_saving:
+                    best_i, best_saving = i, saving
+                prev = route[i]
+            keep[best_i] = False
+            load -= demands[route[best_i]]
+
+    ejected = route[~keep]
+    route, start = compact(route, start, keep)
+    return route, start, ejected
+
+
+@njit
+def cheapest_insertion(route, start, D, demands, Q, nodes):
+    '''Insere os vértices na posição de menor custo que respeita a capacidade.
+
+    Os vértices são inseridos na ordem dada. Quando nenhuma rota comporta o
+    vértice, uma nova rota é criada para ele.
+    '''
+    for c in nodes:
+        n = route.shape[0]
+        route_id = np.cumsum(start) - 1
+        loads = np.zeros(max(route_id[-1] + 1, 1), dtype=np.int64)
+        for i in range(1, n):
+            loads[route_id[i]] += demands[route[i]]
+
+        # nova rota é sempre possível
+        best_cost = D[0, c] + D[c, 0]
+        best_i, best_new_start = n, True
+        for i in range(1, n+1):
+            # antes do vértice da posição i, na mesma rota
+            if i < n and loads[route_id[i]] + demands[c] <= Q:
+                prev = 0 if start[i] else route[i-1]
+                cost = D[prev, c] + D[c, route[i]] - D[prev, route[i]]
+                if cost < best_cost:
+                    best_cost, best_i, best_new_start = cost, i, start[i]
+            # depois do último vértice da rota anterior
+            if i > 1 and (i == n or start[i]) and loads[route_id[i-1]] + demands[c] <= Q:
+                prev = route[i-1]
+                cost = D[prev, c] + D[c, 0] - D[prev, 0]
+                if cost < best_cost:
+                    best_cost, best_i, best_new_start = cost, i, False
+
+        new_route = np.zeros(n+1, dtype=np.int32)
+        new_start = np.zeros(n+1, dtype=np.bool_)
+        new_route[:best_i] = route[:best_i]
+        new_start[:best_i] = start[:best_i]
+        new_route[best_i] = c
+        new_start[best_i] = best_new_start
+        new_route[best_i+1:] = route[best_i:]
+        new_start[best_i+1:] = start[best_i:]
+        # o vértice inserido no início de uma rota herda a marcação de início
+        if best_i < n and best_new_start:
+            new_start[best_i+1] = False
+        route, start = new_route, new_start
+
+    return route, start
+
+
+def improve_for(route: np.ndarray, start: np.ndarray, D: np.ndarray, demands: np.ndarray, Q: int, time_limit: float = 0.1, k: int = 5, alpha: float = 0.3) -> 'tuple[np.ndarray, np.ndarray]':
+    '''Melhora a solução por um tempo limitado.
+
+    Aplica a busca local de primeira melhora seguida da otimização intra-rota
+    e, enquanto houver tempo, perturbações no estilo do ILS, mantendo sempre
+    a melhor solução.
+
+    Args:
+        route (np.ndarray): vetor de rotas concatenadas
+        start (np.ndarray): vetor que marca os inícios de rota
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+        time_limit (float): tempo máximo em segundos
+        k (int): número de vértices removidos em cada perturbação
+        alpha (float): parâmetro da reconstrução semi-gulosa
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: melhor solução encontrada
+    '''
+    t0 = time()
+    nn = nearest_neighbours(D, 10)
+    route, start = improve(route, start, D, demands, Q, True, True, nn)
+    best_cost = calculate_cost(route, start, D)
+    k = min(k, route.shape[0] - 1)
+    while k > 0 and time() - t0 < time_limit:
+        new_route, new_start = shake(route, start, D, demands, Q, k, alpha)
+        new_route, new_start = improve(new_route, new_start, D, demands, Q, True, True, nn)
+        cost = calculate_cost(new_route, new_start, D)
+        if cost < best_cost:
+            route, start, best_cost = new_route, new_start, cost
+    return route, start
+
+
+def reoptimize(route: np.ndarray, start: np.ndarray, D: np.ndarray, demands: np.ndarray, Q: int, coords: np.ndarray, changes: dict, time_limit: float = 0.1) -> 'tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]':
+    '''Reotimiza uma solução anterior após alterações na instância.
+
+    A solução anterior é reparada: clientes cancelados são retirados, rotas
+    que passaram a exceder a capacidade devolvem clientes, e os clientes novos
+    ou devolvidos são inseridos pela inserção mais barata. Em seguida a
+    solução é melhorada por no máximo time_limit segundos.
+
+    Args:
+        route (np.ndarray): vetor de rotas concatenadas da solução anterior
+        start (np.ndarray): vetor de inícios de rota da solução anterior
+        D (np.ndarray): matriz de distâncias
+        demands (np.ndarray): vetor de demandas
+        Q (int): capacidade dos veículos
+        coords (np.ndarray): posições (x, y) de cada nó
+        changes (dict): alterações da instância (ver update_instance)
+        time_limit (float): tempo máximo de melhoria em segundos
+
+    Returns:
+        tuple: rotas, inícios de rota, matriz de distâncias, demandas,
+        coordenadas e mapeamento dos índices antigos para os novos
+    '''
+    D, demands, coords, mapping = update_instance(D, demands, coords, changes)
+    route = mapping[route]
+    keep = route >= 0
+    route, start = compact(route, start, keep)
+    route, start, ejected = eject_overloaded(route, start, D, demands, Q)
+
+    added = np.arange(mapping.max() + 1, D.shape[0], dtype=np.int32)
+    route, start = cheapest_insertion(route, start, D, demands, Q, np.concatenate((added, ejected)))
+    route, start = improve_for(route, start, D, demands, Q, time_limit)
+
+    return route, start, D, demands, coords, mapping
@@ -0,0 +1,388 @@
+import heapq
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+from urllib import request
+from cvrp_input import prepare_input
+from greedy import greedy
+from utils import calculate_cost, is_valid
+import metaheuristics
+import progress
+import archive
+
+
+# cache das instâncias já lidas em cada processo trabalhador
+_instances = {}
+
+
+# parâmetros que fazem cada metaheurística terminar rápido no aquecimento
+WARM_UP_PARAMS = {
+    'grasp': {'non_improving_iter': 1},
+    'grasp_path_relinking': {'non_improving_iter': 1},
+    'ils': {'non_improving_iter': 1},
+    'simulated_annealing': {'T_max': 1, 'T_min': 0.5},
+    'do_tabu_search': {},
+    'grasp_tabu': {'non_improving_iter': 1},
+    'ils_tabu': {'non_improving_iter': 1},
+}
+
+
+def warm_up():
+    '''Compila as funções JIT do processo resolvendo instâncias pequenas.
+
+    Cada metaheurística é executada por solve, com a mesma forma de chamada
+    dos trabalhos, em uma instância com distâncias int16 e outra com
+    distâncias int32 (e com um arquivo de soluções elite temporário), de modo
+    que o primeiro trabalho já encontre todas as especializações compiladas.
+    '''
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in [100, 100000]:
+            coords = rng.integers(0, scale, (12, 2))
+            demands = rng.integers(1, 10, 12)
+            filepath = os.path.join(directory, f'warm-up-{scale}.vrp')
+            with open(filepath, 'w') as f:
+                f.write(f'NAME : warm-up-{scale}\nTYPE : CVRP\nDIMENSION : 12\nEDGE_WEIGHT_TYPE : EUC_2D\nCAPACITY : 30\nNODE_COORD_SECTION\n')
+                f.writelines(f' {i + 1} {x} {y}\n' for i, (x, y) in enumerate(coords))
+                f.write('DEMAND_SECTION\n 1 0\n')
+                f.writelines(f' {i + 1} {d}\n' for i, d in enumerate(demands) if i > 0)
+                f.write('DEPOT_SECTION\n 1\n -1\nEOF\n')
+            for metaheuristic, params in WARM_UP_PARAMS.items():
+                solve(filepath, metaheuristic, params, archive_dir=directory)
+            _instances.clear()
+
+
+def solver_arguments(metaheuristic: str, params: 'dict | None' = None) -> dict:
+    '''Completa os parâmetros da metaheurística com os valores padrão.
+
+    O Numba compila uma especialização para cada forma de chamada (quais
+    parâmetros são passados e com quais tipos). Todos os parâmetros opcionais
+    são então passados explicitamente e com o tipo do valor padrão, para que
+    todos os trabalhos usem a especialização compilada em warm_up. Valores de
+    outro tipo são rejeitados em vez de convertidos; apenas inteiros são
+    aceitos onde o padrão é real.
+
+    Raises:
+        ValueError: se a metaheurística não existir
+        TypeError: se algum parâmetro não existir na metaheurística ou tiver
+            tipo diferente do valor padrão
+    '''
+    if metaheuristic not in WARM_UP_PARAMS:
+        raise ValueError(f'metaheurística desconhecida: {metaheuristic}')
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        raise TypeError('params deve ser um dicionário')
+    solver = getattr(metaheuristics, metaheuristic)
+    arguments = {}
+    for name, parameter in inspect.signature(solver.py_func).parameters.items():
+        if parameter.default is inspect.Parameter.empty or name == 'progress':
+            continue
+        value = params.get(name, parameter.default)
+        expected = type(parameter.default)
+        # bool é subclasse de int, então é comparado pelo tipo exato
+        if expected is float and type(value) is int:
+            value = float(value)
+        if type(value) is not expected:
+            raise TypeError(f'{name} deve ser do tipo {expected.__name__}, recebido {value!r}')
+        arguments[name] = value
+    unknown = set(params) - set(arguments)
+    if unknown:
+        raise TypeError(f'parâmetros desconhecidos para {metaheuristic}: {", ".join(sorted(unknown))}')
+    return arguments
+
+
+def load_instance(filepath: str, cache_size: int = 8) -> 'tuple[np.ndarray, np.ndarray, int]':
+    '''Lê a instância, reaproveitando as matrizes já calculadas.
+
+    O cache é indexado pelo caminho e pela data de modificação do arquivo e
+    mantém as cache_size instâncias usadas mais recentemente.
+    '''
+    key = (filepath, os.path.getmtime(filepath))
+    if key in _instances:
+        _instances[key] = _instances.pop(key)
+    else:
+        _instances[key] = prepare_input(filepath)
+        while len(_instances) > cache_size:
+            _instances.pop(next(iter(_instances)))
+    return _instances[key]
+
+
+def solve(filepath: str, metaheuristic: str = 'ils', params: 'dict | None' = None, time_limit: 'float | None' = None, alpha: float = 0, job_id: 'int | None' = None, status: 'dict | None' = None, cancelled: 'dict | None' = None, interval: float = 0.1, archive_dir: 'str | None' = None) -> dict:
+    '''Resolve uma instância em um processo trabalhador.
+
+    Sem limite de tempo a metaheurística é executada uma vez. Com limite, ela
+    é reiniciada a partir da melhor solução enquanto houver tempo; o limite é
+    verificado a cada interval segundos dentro da metaheurística. O progresso
+    é publicado em status[job_id] e a execução é interrompida quando
+    cancelled[job_id] é marcado. Com archive_dir, a execução parte da melhor
+    solução armazenada para a instância e a solução final é arquivada. Os
+    parâmetros omitidos em params recebem os valores padrão (ver
+    solver_arguments).
+    '''
+    t0 = time()
+    D, demands, Q = load_instance(filepath)
+    seeds = archive.best(D, demands, Q, directory=archive_dir) if archive_dir else []
+    route, start = seeds[0] if seeds else greedy(D, demands, Q, float(alpha))
+    best_cost = calculate_cost(route, start, D)
+    solver = getattr(metaheuristics, metaheuristic)
+    arguments = solver_arguments(metaheuristic, params)
+
+    def callback(info):
+        if status is not None:
+            status[job_id] = {**info, 'best_cost': min(info['best_cost'], best_cost)}
+        expired = time_limit is not None and time() - t0 >= time_limit
+        return expired or (cancelled is not None and cancelled.get(job_id, False))
+
+    handle = progress.register(callback, interval)
+    try:
+        while True:
+            new_route, new_start = solver(route, start, D, demands, Q, **arguments, progress=handle)
+            cost = calculate_cost(new_route, new_start, D)
+            if cost <= best_cost:
+                route, start, best_cost = new_route, new_start, cost
+            if time_limit is None or progress.cancelled(handle) or time() - t0 >= time_limit:
+                break
+    finally:
+        progress.unregister(handle)
+    if archive_dir:
+        archive.update(D, demands, Q, [(route, start)], directory=archive_dir)
+
+    return {
+        'cost': int(best_cost),
+        'valid': bool(is_valid(route, start, demands, Q)),
+        'route': route.tolist(),
+        'start': start.tolist(),
+        'time': time() - t0,
+    }
+
+
+class SolverService:
+    '''Serviço de resolução com fila de prioridades e processos aquecidos.
+
+    Os trabalhos são executados em ordem de prioridade (maior primeiro) e, em
+    caso de empate, de chegada. Cada processo compila as funções JIT uma única
+    vez ao iniciar e mantém em cache as instâncias usadas recentemente. Com
+    archive_dir, os trabalhos partem das soluções do arquivo de soluções
+    elite (ver archive.py) e o atualizam ao terminar.
+    '''
+
+    def __init__(self, workers: int = 2, archive_dir: 'str | None' = None):
+        self.workers = workers
+        self.archive_dir = archive_dir
+        # spawn: os processos não herdam o estado das threads do Numba
+        context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(workers, mp_context=context, initializer=warm_up)
+        # progresso e pedidos de cancelamento compartilhados com os processos
+        self.manager = context.Manager()
+        self.status = self.manager.dict()
+        self.cancelled = self.manager.dict()
+        self.jobs = {}
+        self.queue = []
+        self.running = 0
+        self.counter = itertools.count()
+        self.lock = threading.Condition()
+        self.closed = False
+        # inicia e aquece todos os processos antes de aceitar trabalhos
+        for f in [self.executor.submit(os.getpid) for _ in range(workers)]:
+            f.result()
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, instance: str, metaheuristic: str = 'ils', params: 'dict | None' = None, priority: int = 0, time_limit: 'float | None' = None) -> int:
+        '''Enfileira um trabalho e retorna seu identificador.
+
+        Raises:
+            ValueError: se a metaheurística não existir
+            TypeError: se os parâmetros não forem aceitos (ver solver_arguments)
+        '''
+        solver_arguments(metaheuristic, params)
+        with self.lock:
+            job_id = next(self.counter)
+            self.jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'instance': instance,
+                'metaheuristic': metaheuristic,
+                'priority': priority,
+                'submitted': time(),
+                'args': (instance, metaheuristic, params, time_limit),
+            }
+            heapq.heappush(self.queue, (-priority, job_id))
+            self.lock.notify_all()
+        return job_id
+
+    def poll(self, job_id: int) -> 'dict | None':
+        '''Retorna o estado do trabalho (e o resultado, se concluído).
+        '''
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = {k: v for k, v in job.items() if k != 'args'}
+        if job['status'] == 'running':
+            job['progress'] = self.status.get(job_id)
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        '''Cancela um trabalho ainda não concluído.
+
+        Trabalhos na fila são descartados; um trabalho em execução é
+        interrompido na próxima verificação de progresso e seu resultado é
+        ignorado.
+        '''
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] not in ('queued', 'running'):
+                return False
+            if job['status'] == 'running':
+                self.cancelled[job_id] = True
+            job['status'] = 'cancelled'
+            return True
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        self.dispatcher.join()
+        self.executor.shutdown(cancel_futures=True)
+        self.manager.shutdown()
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                while not self.closed and (not self.queue or self.running >= self.workers):
+                    self.lock.wait()
+                if self.closed:
+                    return
+                _, job_id = heapq.heappop(self.queue)
+                job = self.jobs[job_id]
+                if job['status'] == 'cancelled':
+                    continue
+                job['status'] = 'running'
+                job['started'] = time()
+                self.running += 1
+            future = self.executor.submit(solve, *job['args'], job_id=job_id, status=self.status, cancelled=self.cancelled, archive_dir=self.archive_dir)
+            future.add_done_callback(lambda f, job_id=job_id: self._finish(job_id, f))
+
+    def _finish(self, job_id: int, future):
+        with self.lock:
+            self.running -= 1
+            self.status.pop(job_id, None)
+            self.cancelled.pop(job_id, None)
+            job = self.jobs[job_id]
+            job['finished'] = time()
+            if job['status'] != 'cancelled':
+                if future.exception() is not None:
+                    job['status'] = 'failed'
+                    job['error'] = repr(future.exception())
+                else:
+                    job['status'] = 'done'
+                    job['result'] = future.result()
+            self.lock.notify_all()
+
+
+def make_handler(service: SolverService):
+    '''Cria o tratador HTTP da API do serviço.
+
+    POST /jobs enfileira um trabalho (JSON com instance, metaheuristic,
+    params, priority e time_limit), GET /jobs/<id> consulta e
+    DELETE /jobs/<id> cancela.
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _job_id(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+                return int(parts[1])
+            return None
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._reply(404, {'error': 'not found'})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except (ValueError, UnicodeDecodeError) as e:
+                return self._reply(400, {'error': f'invalid JSON: {e}'})
+            if not isinstance(body, dict) or 'instance' not in body:
+                return self._reply(400, {'error': 'missing instance'})
+            try:
+                job_id = service.submit(body['instance'], body.get('metaheuristic', 'ils'), body.get('params'), body.get('priority', 0), body.get('time_limit'))
+            except (TypeError, ValueError) as e:
+                return self._reply(400, {'error': str(e)})
+            self._reply(202, {'id': job_id})
+
+        def do_GET(self):
+            job = service.poll(self._job_id())
+            if job is None:
+                return self._reply(404, {'error': 'not found'})
+            self._reply(200, job)
+
+        def do_DELETE(self):
+            job_id = self._job_id()
+            if service.poll(job_id) is None:
+                return self._reply(404, {'error': 'not found'})
+            self._reply(200, {'cancelled': service.cancel(job_id)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class SolverClient:
+    '''Cliente da API HTTP do serviço.
+    '''
+
+    def __init__(self, url: str = 'http://127.0.0.1:8765'):
+        self.url = url.rstrip('/')
+
+    def _call(self, method: str, path: str, body: 'dict | None' = None) -> dict:
+        data = json.dumps(body).encode() if body is not None else None
+        req = request.Request(self.url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        with request.urlopen(req) as response:
+            return json.loads(response.read())
+
+    def submit(self, instance: str, metaheuristic: str = 'ils', params: 'dict | None' = None, priority: int = 0, time_limit: 'float | None' = None) -> int:
+        body = {'instance': instance, 'metaheuristic': metaheuristic, 'params': params, 'priority': priority, 'time_limit': time_limit}
+        return self._call('POST', '/jobs', body)['id']
+
+    def poll(self, job_id: int) -> dict:
+        return self._call('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id: int) -> bool:
+        return self._call('DELETE', f'/jobs/{job_id}')['cancelled']
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, workers: int = 2):
+    '''Inicia o serviço e atende requisições até ser interrompido.
+    '''
+    service = SolverService(workers)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f'serving on http://{host}:{port} with {workers} workers')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    serve()
@@ -1,9 +1,10 @@
 import numpy as np
-from numba import njit, types
+from numba import types
+from profiling import njit
 from greedy import get_next_node
 from utils import is_valid
 
-@njit(types.Tuple((types.int32[::1], types.boolean[::1]))(types.int32[::1], types.boolean[::1], types.int32[:, ::1], types.int32[::1], types.int64, types.int64, types.float64))
+@njit
 def shake(route, start, D, demands, Q, k=10, alpha=0):
     '''Altera a solução atual, removendo k vértices e reconstruindo a solução
     de forma semi-gulosa.
@@ -0,0 +1,305 @@
+import multiprocessing
+import numpy as np
+import glob
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import cos, exp, expm1, lgamma, log, pi, sin, sqrt
+from statistics import NormalDist
+from cvrp_input import prepare_input
+from greedy import greedy
+from utils import calculate_cost, seed_numba
+import metaheuristics
+
+
+# Espaços de parâmetros de cada metaheurística. Cada parâmetro é descrito por
+# ('int', mínimo, máximo), ('float', mínimo, máximo), ('cat', [opções]) ou
+# ('per_n', mínimo, máximo): um fator multiplicado pelo número de nós.
+SPACES = {
+    'grasp': {
+        'alpha': ('float', 0, 0.5),
+        'non_improving_iter': ('per_n', 0.5, 4),
+        'first_improvement': ('cat', [False, True]),
+    },
+    'grasp_path_relinking': {
+        'alpha': ('float', 0, 0.5),
+        'non_improving_iter': ('per_n', 0.5, 4),
+        'elite_size': ('int', 2, 20),
+        'min_distance': ('int', 1, 10),
+        'first_improvement': ('cat', [False, True]),
+    },
+    'ils': {
+        'k': ('int', 2, 15),
+        'alpha': ('float', 0, 0.5),
+        'non_improving_iter': ('per_n', 0.5, 4),
+        'first_improvement': ('cat', [False, True]),
+        'polish': ('cat', [False, True]),
+    },
+    'simulated_annealing': {
+        'T_max': ('float', 100, 5000),
+        'alpha': ('float', 0.8, 0.99),
+        'M': ('float', 1, 10),
+        'beta': ('float', 1, 1.1),
+    },
+    'grasp_tabu': {
+        'alpha': ('float', 0, 0.5),
+        'non_improving_iter': ('per_n', 0.1, 1),
+    },
+    'ils_tabu': {
+        'k': ('int', 2, 15),
+        'alpha': ('float', 0, 0.5),
+        'non_improving_iter': ('per_n', 0.1, 1),
+    },
+}
+
+
+def sample_configs(space: dict, n_configs: int, rng: np.random.Generator) -> 'list[dict]':
+    '''Sorteia configurações uniformemente no espaço de parâmetros.
+    '''
+    configs = []
+    for _ in range(n_configs):
+        config = {}
+        for name, (kind, *args) in space.items():
+            if kind == 'int':
+                config[name] = int(rng.integers(args[0], args[1] + 1))
+            elif kind == 'cat':
+                config[name] = args[0][rng.integers(len(args[0]))]
+            else:
+                config[name] = float(rng.uniform(args[0], args[1]))
+        configs.append(config)
+    return configs
+
+
+def instantiate(config: dict, space: dict, n: int) -> dict:
+    '''Converte os parâmetros relativos ao tamanho da instância em valores.
+    '''
+    params = dict(config)
+    for name, (kind, *_) in space.items():
+        if kind == 'per_n':
+            params[name] = max(1, int(round(config[name] * n)))
+    return params
+
+
+@lru_cache(maxsize=8)
+def load_instance(filepath: str) -> 'tuple[np.ndarray, np.ndarray, int]':
+    return prepare_input(filepath)
+
+
+def evaluate(filepath: str, metaheuristic: str, config: dict, seed: int) -> int:
+    '''Executa uma configuração em uma instância e retorna o custo obtido.
+    '''
+    D, demands, Q = load_instance(filepath)
+    params = instantiate(config, SPACES[metaheuristic], D.shape[0])
+    seed_numba(seed)
+    route, start = greedy(D, demands, Q, 0)
+    route, start = getattr(metaheuristics, metaheuristic)(route, start, D, demands, Q, **params)
+    return calculate_cost(route, start, D)
+
+
+def chi2_sf(x: float, k: int) -> float:
+    '''Probabilidade de uma variável chi-quadrado com k graus de liberdade
+    exceder x (função gama incompleta regularizada, por série ou fração
+    contínua).
+    '''
+    if x <= 0:
+        return 1.0
+    a, x = k / 2, x / 2
+    if x < a + 1:
+        term = total = 1 / a
+        for i in range(1, 500):
+            term *= x / (a + i)
+            total += term
+            if term < total * 1e-12:
+                break
+        return 1 - total * exp(-x + a * log(x) - lgamma(a))
+    # fração contínua de Lentz
+    b = x + 1 - a
+    c = 1 / 1e-300
+    d = 1 / b
+    h = d
+    for i in range(1, 500):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1 / (d if abs(d) > 1e-300 else 1e-300)
+        c = b + an / c
+        c = c if abs(c) > 1e-300 else 1e-300
+        h *= d * c
+        if abs(d * c - 1) < 1e-12:
+            break
+    return exp(-x + a * log(x) - lgamma(a)) * h
+
+
+def t_quantile(p: float, dof: int) -> float:
+    '''Quantil bicaudal da t de Student: o valor t tal que P(|T| > t) = p
+    com dof graus de liberdade (algoritmo 396 de Hill, 1970, exato para 1 e 2
+    graus de liberdade).
+    '''
+    if dof == 1:
+        p *= pi / 2
+        return cos(p) / sin(p)
+    if dof == 2:
+        return sqrt(2 / (p * (2 - p)) - 2)
+    a = 1 / (dof - 0.5)
+    b = 48 / a ** 2
+    c = ((20700 * a / b - 98) * a - 16) * a + 96.36
+    d = ((94.5 / (b + c) - 3) / b + 1) * sqrt(a * pi / 2) * dof
+    x = d * p
+    y = x ** (2 / dof)
+    if y > 0.05 + a:
+        # expansão assintótica a partir do quantil da normal
+        x = NormalDist().inv_cdf(p / 2)
+        y = x ** 2
+        if dof < 5:
+            c += 0.3 * (dof - 4.5) * (x + 0.6)
+        c = (((0.05 * d * x - 5) * x - 7) * x - 2) * x + b + c
+        y = (((((0.4 * y + 6.3) * y + 36) * y + 94.5) / c - y - 3) / b + 1) * x
+        y = expm1(a * y ** 2)
+    else:
+        y = ((1 / (((dof + 6) / (dof * y) - 0.089 * d - 0.822) * (dof + 2) * 3) + 0.5 / (dof + 4)) * y - 1) * (dof + 1) / (dof + 2) + 1 / y
+    return sqrt(dof * y)
+
+
+def ranks(costs: np.ndarray) -> np.ndarray:
+    '''Posto de cada configuração (colunas) em cada bloco (linhas), com
+    empates recebendo a média dos postos.
+    '''
+    return pd.DataFrame(costs).rank(axis=1).to_numpy()
+
+
+def friedman_survivors(costs: np.ndarray, alpha: float = 0.05) -> np.ndarray:
+    '''Teste de Friedman seguido do teste post-hoc de Conover, como no F-Race.
+
+    Se o teste de Friedman rejeitar a igualdade entre as configurações, são
+    mantidas apenas as que não são significativamente piores que a de menor
+    soma de postos.
+
+    Args:
+        costs (np.ndarray): custos de cada configuração (colunas) em cada bloco (linhas)
+        alpha (float): nível de significância
+
+    Returns:
+        np.ndarray: índices das colunas que continuam na corrida
+    '''
+    b, k = costs.shape
+    R = ranks(costs)
+    rank_sums = R.sum(axis=0)
+    A = (R ** 2).sum()
+    C = b * k * (k + 1) ** 2 / 4
+    if A == C: # todos os blocos empatados
+        return np.arange(k)
+    T = (k - 1) * ((rank_sums - b * (k + 1) / 2) ** 2).sum() / (A - C)
+    if chi2_sf(T, k - 1) >= alpha:
+        return np.arange(k)
+
+    dof = (b - 1) * (k - 1)
+    quantile = t_quantile(alpha, dof)
+    critical = quantile * sqrt(2 * b * (1 - T / (b * (k - 1))) * (A - C) / dof)
+    return np.argwhere(rank_sums - rank_sums.min() <= critical).flatten()
+
+
+def race(metaheuristic: str, files: 'list[str]', n_configs: int = 20, max_blocks: int = 30, first_test: int = 5, alpha: float = 0.05, workers: int = 1, seed: int = 0, executor: 'ProcessPoolExecutor | None' = None) -> 'tuple[dict, pd.DataFrame]':
+    '''Seleciona a melhor configuração de uma metaheurística por corrida (F-Race).
+
+    Cada bloco é uma execução em uma instância (as instâncias são repetidas
+    com outras sementes até max_blocks). Todas as configurações vivas são
+    avaliadas no bloco, em paralelo, e a partir de first_test blocos as
+    configurações estatisticamente dominadas são eliminadas.
+
+    Args:
+        metaheuristic (str): nome da função em metaheuristics
+        files (list[str]): instâncias usadas na corrida
+        n_configs (int): número de configurações sorteadas
+        max_blocks (int): número máximo de blocos
+        first_test (int): número de blocos antes do primeiro teste
+        alpha (float): nível de significância
+        workers (int): número de processos
+        seed (int): semente do sorteio das configurações e das execuções
+        executor (ProcessPoolExecutor | None): processos já iniciados
+
+    Returns:
+        tuple[dict, pd.DataFrame]: melhor configuração e custos de cada execução
+    '''
+    rng = np.random.default_rng(seed)
+    space = SPACES[metaheuristic]
+    configs = sample_configs(space, n_configs, rng)
+    alive = np.arange(n_configs)
+    costs = []
+    rows = []
+
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for block in range(max_blocks):
+            filepath = files[block % len(files)]
+            run_seed = seed + block
+            args = [(filepath, metaheuristic, configs[c], run_seed) for c in alive]
+            if executor is None:
+                results = [evaluate(*a) for a in args]
+            else:
+                results = list(executor.map(evaluate, *zip(*args)))
+
+            block_costs = np.full(n_configs, np.nan)
+            block_costs[alive] = results
+            costs.append(block_costs)
+            for c, cost in zip(alive, results):
+                rows.append({'block': block, 'instance': filepath, 'seed': run_seed, 'config': c, 'cost': cost, **configs[c]})
+
+            if block + 1 >= first_test and alive.shape[0] > 1:
+                alive = alive[friedman_survivors(np.array(costs)[:, alive], alpha)]
+            if alive.shape[0] == 1:
+                break
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    # entre as sobreviventes, a de menor posto médio
+    best = alive[np.argmin(ranks(np.array(costs)[:, alive]).mean(axis=0))]
+    return configs[best], pd.DataFrame(rows)
+
+
+def size_class(n: int, bounds: 'tuple[int]') -> str:
+    '''Nome da classe de tamanho à qual uma instância com n nós pertence.
+    '''
+    lower = 0
+    for upper in bounds:
+        if n < upper:
+            return f'{lower}-{upper}'
+        lower = upper
+    return f'{lower}+'
+
+
+def tune(metaheuristic: str, files: 'list[str]', bounds: 'tuple[int]' = (50, 100), workers: int = 1, **kwargs) -> 'tuple[dict, pd.DataFrame]':
+    '''Executa uma corrida para cada classe de tamanho de instância.
+
+    Returns:
+        tuple[dict, pd.DataFrame]: melhor configuração de cada classe e custos de todas as execuções
+    '''
+    classes = {}
+    for filepath in files:
+        n = load_instance(filepath)[0].shape[0]
+        classes.setdefault(size_class(n, bounds), []).append(filepath)
+
+    best = {}
+    tables = []
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1 else None
+    try:
+        for name, class_files in classes.items():
+            print(name, len(class_files))
+            best[name], table = race(metaheuristic, class_files, executor=executor, **kwargs)
+            table['class'] = name
+            tables.append(table)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return best, pd.concat(tables)
+
+
+if __name__ == '__main__':
+    files = glob.glob('./A-VRP/*.vrp')
+    for metaheuristic in ['grasp', 'ils', 'simulated_annealing']:
+        best, table = tune(metaheuristic, files, workers=4)
+        table.to_csv(f'results/tuning_{metaheuristic}.tsv', sep='\t')
+        print(metaheuristic, best)
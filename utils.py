@@ -1,5 +1,18 @@
 import numpy as np
-from numba import njit, types
+from numba import prange, types
+from profiling import njit
+
+# A matriz de distâncias pode ser int16, int32 ou float32 (ver
+# cvrp_input.distance_dtype). As funções que recebem D são especializadas pelo
+# Numba no primeiro uso de cada tipo, então só é compilado o tipo usado; os
+# custos são acumulados em int64, ou em float64 para distâncias não
+# arredondadas.
+
+# variação mínima para que um movimento seja considerado uma melhora; com
+# distâncias inteiras equivale a delta < 0, com distâncias em ponto flutuante
+# evita ciclos causados por erros de arredondamento
+EPSILON = 1e-3
+
 
 def print_routes(route, start, D, demands):
     r = 0
@@ -56,7 +69,7 @@ def is_valid(route, start, demands, Q):
     return np.all(visited == 1) and current_capacity <= Q
 
 
-@njit(types.int64(types.int32[::1], types.boolean[::1], types.int32[:, ::1]))
+@njit
 def calculate_cost(route, start, D):
     '''Calcula o custo da solução somando as distâncias que cada veículo percorre.
 
@@ -77,4 +90,114 @@ def calculate_cost(route, start, D):
         prev = n # atualiza vértice anterior
     
     cost += D[prev, 0] # chegou ao fim da última rota, precisamos voltar ao depósito
-    return cost
\ No newline at end of file
+    return cost
+
+@njit
+def zero_costs(D, n):
+    '''Cria um vetor de n custos zerados, do tipo em que as distâncias de D
+    são acumuladas.
+    '''
+    # a diagonal de D é nula; somar o literal promove int16/int32 a int64 e
+    # float32 a float64
+    return np.full(n, D[0, 0] + 0)
+
+
+@njit
+def nearest_neighbours(D, K):
+    '''Calcula a lista dos K clientes mais próximos de cada nó.
+
+    O próprio nó e o depósito não fazem parte da lista.
+    '''
+    n = D.shape[0]
+    K = min(K, n - 2)
+    # sem vizinhos (polimento desligado) não é preciso ordenar as linhas
+    if K <= 0:
+        return np.zeros((n, 0), dtype=np.int32)
+    nn = np.zeros((n, K), dtype=np.int32)
+    for i in range(n):
+        order = np.argsort(D[i])
+        k = 0
+        for j in order:
+            if k == K:
+                break
+            if j != i and j != 0:
+                nn[i, k] = j
+                k += 1
+    return nn
+
+
+@njit(parallel=True)
+def batch_calculate_cost(routes, starts, D):
+    '''Calcula o custo de várias soluções da mesma instância em paralelo.
+
+    Cada linha de routes e starts é uma solução na representação de rotas
+    concatenadas.
+    '''
+    costs = zero_costs(D, routes.shape[0])
+    for b in prange(routes.shape[0]):
+        costs[b] = calculate_cost(routes[b], starts[b], D)
+    return costs
+
+
+@njit(types.boolean[::1](types.int32[:, ::1], types.boolean[:, ::1], types.int32[::1], types.int64), parallel=True)
+def batch_is_valid(routes, starts, demands, Q):
+    '''Verifica a validade de várias soluções da mesma instância em paralelo.
+
+    Cada linha de routes e starts é uma solução na representação de rotas
+    concatenadas.
+    '''
+    valid = np.zeros(routes.shape[0], dtype=np.bool_)
+    for b in prange(routes.shape[0]):
+        valid[b] = is_valid(routes[b], starts[b], demands, Q)
+    return valid
+
+
+def stack_solutions(solutions: 'list[tuple[np.ndarray, np.ndarray]]') -> 'tuple[np.ndarray, np.ndarray]':
+    '''Empilha uma lista de soluções (route, start) em duas matrizes para
+    as funções batch_calculate_cost e batch_is_valid.
+    '''
+    routes = np.ascontiguousarray(np.stack([r for r, _ in solutions]), dtype=np.int32)
+    starts = np.ascontiguousarray(np.stack([s for _, s in solutions]), dtype=np.bool_)
+    return routes, starts
+
+
+@njit
+def lower_bound(D, demands, Q):
+    '''Calcula um limitante inferior simples para o custo ótimo.
+
+    São necessários pelo menos k = ⌈Σdemandas/Q⌉ veículos. Removendo de cada
+    rota a aresta de retorno ao depósito obtemos uma árvore geradora, e as
+    arestas removidas ligam ao depósito clientes distintos. Logo o custo é
+    pelo menos o da árvore geradora mínima somado às k menores distâncias
+    entre o depósito e um cliente.
+    '''
+    n = D.shape[0]
+    k = (demands.sum() + Q - 1) // Q
+
+    # árvore geradora mínima (Prim), a partir do depósito
+    in_tree = np.zeros(n, dtype=np.bool_)
+    in_tree[0] = True
+    dist = zero_costs(D, n)
+    dist[:] = D[0]
+    mst = 0
+    for _ in range(n - 1):
+        u = -1
+        for v in range(n):
+            if not in_tree[v] and (u == -1 or dist[v] < dist[u]):
+                u = v
+        in_tree[u] = True
+        mst += dist[u]
+        for v in range(n):
+            if not in_tree[v] and D[u, v] < dist[v]:
+                dist[v] = D[u, v]
+
+    for d in np.sort(D[0, 1:])[:k]:
+        mst += d
+    return mst
+
+
+@njit(types.void(types.int64))
+def seed_numba(seed):
+    '''Inicializa o gerador aleatório usado dentro das funções compiladas.
+    '''
+    np.random.seed(seed)